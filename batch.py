@@ -0,0 +1,158 @@
+###############################################################################
+#                                                                             #
+#          GAKUSEI BATCH - self-play and SGF analysis over a process pool     #
+#                                                                             #
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import collections
+import multiprocessing
+import gakusei
+
+def init_worker():
+  '''
+  Batch worker process initializer, silences root move
+  scores searches print to STDERR
+  '''
+  sys.stderr = open(os.devnull, 'w')
+
+def think(engine, color):
+  '''
+  Searches and plays a move for a given color, returns
+  the move, its score for the color, nodes and seconds
+  '''
+  position = engine.position
+  key = position.position_key() if color == position.side else None
+  nodes = engine.nodes
+  start = time.perf_counter()
+  move = engine.search('genmove ' + ('b' if color == gakusei.BLACK else 'w')).split()[1]
+  elapsed = time.perf_counter() - start
+  entry = engine.tt_probe(key) if key is not None else None
+  if move == 'pass': position.side = 3 - color
+  return move, entry[3] if entry is not None else None, engine.nodes - nodes, round(elapsed, 6)
+
+def play_game(task):
+  '''
+  Plays a self-play game, the first opening moves are
+  picked at random among legal points off the first two
+  lines using the seed of the game, the engine takes over
+  once there are none, returns the game record
+  '''
+  index, seed, size, depth, max_moves, opening = task
+  dice = random.Random(seed)
+  engine = gakusei.Engine()
+  engine.max_depth = depth
+  position = engine.position
+  position.init_board(size + 2)
+  record = {'game': index, 'seed': seed, 'size': size, 'moves': [], 'scores': [], 'nodes': [], 'seconds': []}
+  color = gakusei.BLACK
+  passes = 0
+  while len(record['moves']) < max_moves and passes < 2:
+    if len(record['moves']) < opening:
+      points = [row * position.width + col for row in range(3, size-1) for col in range(3, size-1)]
+      points = [square for square in points if position.board[square] == gakusei.EMPTY and
+                square != position.ko and not position.is_suicide(square, color)]
+      if not points: opening = 0; continue
+      square = dice.choice(points)
+      position.play(square, color)
+      move, score, nodes, elapsed = position.move_to_string(square), None, 0, 0.0
+    else: move, score, nodes, elapsed = think(engine, color)
+    passes = passes + 1 if move == 'pass' else 0
+    for field, value in zip(['moves', 'scores', 'nodes', 'seconds'], [move, score, nodes, elapsed]):
+      record[field].append(value)
+    color = 3 - color
+  record['score'] = position.score
+  return record
+
+def analyze_game(task):
+  '''
+  Searches the position before every move of SGF game,
+  returns the game record
+  '''
+  path, number, game, depth = task
+  engine = gakusei.Engine()
+  engine.max_depth = depth
+  position = engine.position
+  width = gakusei.sgf_width(game)
+  played = [(gakusei.BLACK if 'B' in node else gakusei.WHITE, node.get('B', node.get('W'))[0])
+            for node in game if 'B' in node or 'W' in node]
+  record = {'file': path, 'game': number, 'size': width - 2, 'played': [], 'moves': [],
+            'scores': [], 'nodes': [], 'seconds': []}
+  for limit, (color, value) in enumerate(played):
+    position.init_board(width)
+    position.setup(gakusei.sgf_moves(game, width, limit))
+    square = gakusei.sgf_square(value, width)
+    move, score, nodes, elapsed = think(engine, color)
+    record['played'].append(position.move_to_string(square) if square != gakusei.NONE else 'pass')
+    for field, value in zip(['moves', 'scores', 'nodes', 'seconds'], [move, score, nodes, elapsed]):
+      record[field].append(value)
+  record['matched'] = sum(1 for move, played in zip(record['moves'], record['played']) if move == played)
+  return record
+
+def sgf_files(paths):
+  '''
+  Returns SGF files given directly or found in directories
+  '''
+  files = []
+  for path in paths:
+    if not os.path.isdir(path): files.append(path); continue
+    for root, dirs, names in os.walk(path):
+      dirs.sort()
+      files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith('.sgf'))
+  return files
+
+def sgf_games(files, depth):
+  '''
+  Yields an analysis task for every game of SGF files,
+  reading the files only as far as tasks are taken
+  '''
+  for path in files:
+    with open(path, encoding='utf-8', errors='replace') as file:
+      for number, game in enumerate(gakusei.read_sgf(file)):
+        yield path, number, game, depth
+
+def run(function, tasks, processes, output):
+  '''
+  Runs tasks over a process pool, writes every result as a
+  JSON line as soon as it and the results before it are
+  done, so the output does not depend on the pool size,
+  only two tasks per process are taken ahead of the output
+  '''
+  with multiprocessing.Pool(processes, initializer=init_worker) as pool:
+    pending = collections.deque()
+    tasks = iter(tasks)
+    while True:
+      for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= processes * 2: break
+      if not pending: break
+      output.write(json.dumps(pending.popleft().get()) + '\n')
+      output.flush()
+
+# MAIN
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Gakusei batch self-play and SGF analysis')
+  parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of worker processes')
+  parser.add_argument('--depth', type=int, default=3, help='iterative deepening depth of searches')
+  parser.add_argument('--output', help='JSONL file to write, STDOUT by default')
+  commands = parser.add_subparsers(dest='command', required=True)
+  selfplay = commands.add_parser('selfplay', help='play engine against itself')
+  selfplay.add_argument('--games', type=int, default=10, help='number of games')
+  selfplay.add_argument('--size', type=int, default=9, help='board size')
+  selfplay.add_argument('--seed', type=int, default=0, help='seed of the first game, next games count up from it')
+  selfplay.add_argument('--max-moves', type=int, default=200, help='moves after which a game is stopped')
+  selfplay.add_argument('--opening', type=int, default=4, help='random moves starting every game')
+  analyze = commands.add_parser('analyze', help='search every position of SGF games')
+  analyze.add_argument('paths', nargs='+', help='SGF files or directories')
+  args = parser.parse_args()
+  output = open(args.output, 'w') if args.output else sys.stdout
+  if args.command == 'selfplay':
+    tasks = ((index, args.seed + index, args.size, args.depth, args.max_moves, args.opening) for index in range(args.games))
+    run(play_game, tasks, max(args.processes, 1), output)
+  else: run(analyze_game, sgf_games(sgf_files(args.paths), args.depth), max(args.processes, 1), output)
+  if output is not sys.stdout: output.close()
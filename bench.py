@@ -0,0 +1,390 @@
+###############################################################################
+#                                                                             #
+#              GAKUSEI BENCHMARK - reproducible performance suite             #
+#                                                                             #
+###############################################################################
+
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+import gakusei
+
+try: import resource
+except ImportError: resource = None
+
+# FIXED POSITIONS           # (name, board size, perft depth, moves played alternately starting with black)
+positions = [
+  ('9x9 opening', 9, 2, 'D6 F4 F6 D4 C7 G7 F7 G6 F8 G8 G5 H6'),
+  ('9x9 middle game', 9, 3,
+   'D6 F4 F6 D4 C7 G7 F7 G6 F8 G8 G5 H6 G4 H5 G3 F5 F3 H4 F9 H3 G9 C3 E4 E5 D5 E3 F2 E6 E2 E7 E8 D7 C6 D8 C8 B3'),
+  ('13x13 opening', 13, 2, 'D10 K10 D4 K4 G10 D7 K7 G4 C11 L11 C6 D6 C7 D5 C8 C5 D8 E5 E4 F5'),
+  ('13x13 middle game', 13, 2,
+   'D10 K10 D4 K4 G10 D7 K7 G4 C11 L11 C6 D6 C7 D5 C8 C5 D8 E5 E4 F5 C4 F4 L6 H8 J3 J4 K3 H3 L4 L3 '
+   'J2 M4 H2 M3 L5 M5 K5 J5 M6 N5 N6 F11 G11 F10 F12 E11 G9 E10 G8 F9'),
+  ('19x19 opening', 19, 2,
+   'D16 Q16 D4 Q4 K16 D10 Q10 K4 G17 N17 C13 R13 C7 R7 G3 N3 G13 L13 H10 M10 G7 L7 O14 O6 C17 R17 C3 R3 F15 N12'),
+  ('19x19 middle game', 19, 2,
+   'D16 Q16 D4 Q4 K16 D10 Q10 K4 G17 N17 C13 R13 C7 R7 G3 N3 G13 L13 H10 M10 G7 L7 O14 O6 C17 R17 C3 R3 F15 N12 '
+   'N8 F5 J14 E12 K11 F9 J8 M15 M5 R11 Q11 R10 Q12 R12 Q13 Q14 R14 P13 R9 S10 Q15 P14 Q9 S9 R15 P12 R16 P15 Q17 P16 '
+   'Q18 P17 P18 P11 O17 O16 R18 S17 P10 O15 O18 S16 N18 S15 M17 N16 M18 S14 M16 O13')
+]
+
+# BENCHMARKED GAME
+engine = gakusei.Engine()
+position = engine.position
+
+# TIMED FUNCTIONS           # name -> call made on the loaded position
+calls = {
+  'genmove': lambda: position.genmove(position.side),
+  'match_pattern': lambda: position.match_pattern(position.side),
+  'update_groups': lambda: position.update_groups(),
+  'evaluate': lambda: position.evaluate(),
+  'is_suicide': lambda: [position.is_suicide(square, position.side) for square in empty_squares()],
+  'make_group': lambda: [position.make_group(square, position.board[square]) for square in stone_squares()]
+}
+
+def empty_squares():
+  '''
+  Returns empty squares of the loaded position
+  '''
+  return [square for square in range(len(position.board)) if position.board[square] == gakusei.EMPTY]
+
+def stone_squares():
+  '''
+  Returns squares of stones of the loaded position
+  '''
+  return [square for square in range(len(position.board)) if 0 < position.board[square] < gakusei.FENCE]
+
+def load(size, moves):
+  '''
+  Sets up a position by playing moves on an empty board
+  '''
+  position.init_board(size + 2)
+  color = gakusei.BLACK
+  for move in moves.split():
+    position.play(position.string_to_move(move), color)
+    color = 3 - color
+
+def reset_search():
+  '''
+  Clears transposition table so every search starts cold
+  '''
+  engine.set_tt_size(len(engine.tt))
+  engine.tt_age = 0
+
+def time_call(function, repeat, rounds=5):
+  '''
+  Returns mean seconds per call of a function in the
+  fastest of a few rounds, which keeps timings steady
+  on a busy machine
+  '''
+  best = None
+  for _ in range(rounds):
+    start = time.perf_counter()
+    for _ in range(repeat): function()
+    elapsed = (time.perf_counter() - start) / repeat
+    if best is None or elapsed < best: best = elapsed
+  return best
+
+def search():
+  '''
+  Runs the engine's iterative deepening search on the loaded
+  position the way GTP "genmove" does, takes the move back,
+  returns the move, nodes searched and seconds spent
+  '''
+  reset_search()
+  engine.nodes = 0
+  color = 'b' if position.side == gakusei.BLACK else 'w'
+  start = time.perf_counter()
+  with contextlib.redirect_stderr(io.StringIO()): response = engine.search('genmove ' + color)
+  elapsed = time.perf_counter() - start
+  move = response.split()[1]
+  if move != 'pass': position.undo()
+  return move, engine.nodes, elapsed
+
+def perft(depth):
+  '''
+  Counts leaves of the legal move tree, passes excluded
+  '''
+  if depth == 0: return 1
+  leaves = 0
+  color = position.side
+  for square in range(position.width * position.width):
+    if position.board[square] != gakusei.EMPTY or square == position.ko: continue
+    if position.is_suicide(square, color): continue
+    position.play(square, color)
+    leaves += perft(depth - 1)
+    position.undo()
+  return leaves
+
+def leaf_rates(repeat):
+  '''
+  Scores every genmove() child of the loaded position one
+  at a time and in a single numpy batch, returns leaves per
+  second of both
+  '''
+  color = position.side
+  moves = position.genmove(color)
+  def scalar():
+    for move in moves:
+      position.play(move[0], color)
+      position.evaluate()
+      position.undo()
+  scalar_s = time_call(scalar, repeat)
+  batch_s = time_call(lambda: engine.evaluate_children(moves, color), repeat)
+  return int(len(moves) / scalar_s), int(len(moves) / batch_s)
+
+def peak_memory():
+  '''
+  Returns peak memory in kilobytes allocated by a search
+  '''
+  tracemalloc.start()
+  search()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak // 1024
+
+def run(args):
+  '''
+  Benchmarks every fixed position, returns results by position name
+  '''
+  results = {}
+  for name, size, depth, moves in positions:
+    load(size, moves)
+    result = {}
+    for call, function in calls.items():
+      result[call + '_us'] = round(time_call(function, args.repeat) * 1e6, 1)
+    move, nodes, elapsed = search()
+    result.update({
+      'move': move, 'evaluate': position.evaluate(), 'nodes': nodes,
+      'search_s': round(elapsed, 3), 'nps': int(nodes / elapsed) if elapsed else 0
+    })
+    if args.memory: result['peak_kb'] = peak_memory()
+    if args.leaves: result['scalar_leaves'], result['batch_leaves'] = leaf_rates(args.repeat)
+    if not args.no_perft:
+      start = time.perf_counter()
+      result['perft'] = perft(depth)
+      result['perft_s'] = round(time.perf_counter() - start, 3)
+    results[name] = result
+    print('%-18s %-4s %6d nodes %8d nps %7.3fs search' % (name, move, nodes, result['nps'], elapsed), end='')
+    print(''.join(' %s %.1fus' % (call, result[call + '_us']) for call in calls), end='')
+    if 'perft' in result: print(' perft(%d) %d' % (depth, result['perft']), end='')
+    if 'peak_kb' in result: print(' peak %dKB' % result['peak_kb'], end='')
+    if 'batch_leaves' in result:
+      print(' leaves/s scalar %d batch %d' % (result['scalar_leaves'], result['batch_leaves']), end='')
+    print()
+  return results
+
+def scaling(counts):
+  '''
+  Times the search of every position with each number of
+  root search processes, returns seconds by position name
+  '''
+  times = {}
+  for name, size, depth, moves in positions:
+    load(size, moves)
+    times[name] = []
+    for threads in counts:
+      engine.threads = threads
+      move, nodes, elapsed = search()
+      times[name].append(elapsed)
+      print('%-18s %d threads %-4s %6d nodes %7.3fs speedup %.2f' % (
+        name, threads, move, nodes, elapsed, times[name][0] / elapsed))
+  engine.threads = 1
+  if engine.pool is not None: engine.pool.terminate(); engine.pool = None
+  return times
+
+def load_test(clients, moves, depth, workers):
+  '''
+  Starts GTP server on a local socket and lets many clients
+  play 9x9 games against themselves at once, reports
+  genmove latency and latency of a quick command sent
+  after every genmove while other clients are searching
+  '''
+  path = os.path.join(tempfile.mkdtemp(), 'gakusei.sock')
+  server = subprocess.Popen(
+    [sys.executable, gakusei.__file__, '--serve', path, '--depth', str(depth), '--workers', str(workers)],
+    stderr=subprocess.DEVNULL)
+  latencies = {'genmove': [], 'name': []}
+  async def client(index):
+    reader, writer = await asyncio.open_unix_connection(path)
+    async def send(command):
+      start = time.perf_counter()
+      writer.write((command + '\n').encode())
+      await writer.drain()
+      response = await reader.readuntil(b'\n\n')
+      latencies.setdefault(command.split()[0], []).append(time.perf_counter() - start)
+      return response
+    await send('boardsize 9')
+    await send('play b %s%d' % ('ABCDEFGHJ'[index % 9], 1 + index // 9 % 9))
+    for move in range(moves):
+      await send('genmove ' + 'wb'[move % 2])
+      await send('name')
+    await send('quit')
+    writer.close()
+  async def main():
+    await asyncio.gather(*[client(index) for index in range(clients)])
+  try:
+    for _ in range(100):
+      if os.path.exists(path): break
+      time.sleep(0.1)
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+  finally:
+    server.terminate()
+    server.wait()
+  print('%d clients %d genmoves in %.3fs, %.1f genmoves/s' % (
+    clients, len(latencies['genmove']), elapsed, len(latencies['genmove']) / elapsed))
+  for command in ['genmove', 'name']:
+    times = sorted(latencies[command])
+    print('%-8s latency median %.4fs 95%% %.4fs max %.4fs' % (
+      command, times[len(times) // 2], times[len(times) * 95 // 100], times[-1]))
+  return elapsed
+
+def check_numpy():
+  '''
+  Compares numpy influence map, evaluate() and evaluate_boards()
+  against incremental influence and evaluation and influence
+  computed from scratch on every fixed position with both
+  board backends, returns the number of differences found
+  '''
+  if gakusei.numpy is None:
+    print('numpy is not installed, numpy check skipped')
+    return 0
+  differences = 0
+  for backend in sorted(gakusei.backends):
+    for name, size, depth, moves in positions:
+      board = gakusei.backends[backend](size + 2)
+      color = gakusei.BLACK
+      for move in moves.split():
+        board.play(board.string_to_move(move), color)
+        color = 3 - color
+      squares = range(len(board.board))
+      scratch = [board.get_influence(square) for square in squares]
+      problems = []
+      if board.influence_values != scratch: problems.append('incremental influence')
+      if board.influence_map().tolist() != scratch: problems.append('numpy influence_map()')
+      score = board.evaluate()
+      board.use_numpy = True
+      if board.evaluate() != score: problems.append('numpy evaluate() %d, incremental %d' % (board.evaluate(), score))
+      board.use_numpy = False
+      stacked = gakusei.numpy.frombuffer(board.board, dtype=gakusei.numpy.uint8).reshape(1, board.width, board.width)
+      black_score = score if board.side == gakusei.BLACK else -score
+      if board.evaluate_boards(stacked).tolist() != [black_score]: problems.append('evaluate_boards()')
+      for problem in problems: print('%s %s: %s differs' % (backend, name, problem))
+      differences += len(problems)
+  print('numpy check: %d differences' % differences)
+  return differences
+
+def check_sgf():
+  '''
+  Checks side to move and number of stones of positions
+  loaded from SGF games before a given move number,
+  returns the number of differences found
+  '''
+  cases = [ # (game, move number, side to move, stones)
+    ('(;SZ[9]AB[cc][gg]AW[cg]PL[W];W[ee];B[dd])', 1, gakusei.WHITE, 3),
+    ('(;SZ[9]AB[cc][gg]AW[cg]PL[W];W[ee];B[dd])', 2, gakusei.BLACK, 4),
+    ('(;SZ[9]AB[cc][gg]AW[cg]PL[W];W[ee];B[dd])', None, gakusei.WHITE, 5),
+    ('(;SZ[9]AW[cc]AB[gg]PL[B];B[ee])', 1, gakusei.BLACK, 2),
+    ('(;SZ[9];B[cc];W[dd];AB[ee]PL[B];B[ff])', 2, gakusei.WHITE, 1),
+    ('(;SZ[9];B[cc];W[dd];AB[ee]PL[B];B[ff])', 3, gakusei.BLACK, 3)
+  ]
+  differences = 0
+  for game, number, side, stones in cases:
+    path = os.path.join(tempfile.mkdtemp(), 'check.sgf')
+    with open(path, 'w') as file: file.write(game)
+    params = [path] + ([str(number)] if number is not None else [])
+    engine.execute('loadsgf ' + ' '.join(params))
+    count = sum(1 for stone in position.board if stone in (gakusei.BLACK, gakusei.WHITE))
+    if (position.side, count) != (side, stones):
+      print('%s move %s: side %d stones %d, expected side %d stones %d' % (game, number, position.side, count, side, stones))
+      differences += 1
+    os.remove(path)
+  print('SGF check: %d differences' % differences)
+  return differences
+
+def compare(results, baseline, tolerance, floor_us, floor_s):
+  '''
+  Reports move choice, evaluation, node and perft changes against
+  the baseline, then timings slower than the tolerance allows
+  by more than the floor, which are reported as drift only,
+  returns the number of behaviour changes found
+  '''
+  changes = 0
+  drifts = []
+  for name, result in results.items():
+    if name not in baseline:
+      print(name + ': not in baseline')
+      continue
+    base = baseline[name]
+    for field in ['move', 'evaluate', 'nodes', 'perft']:
+      if field in result and field in base and result[field] != base[field]:
+        print('%s: %s changed %s -> %s' % (name, field, base[field], result[field]))
+        changes += 1
+    for field in result:
+      if field.endswith('_us'): floor = floor_us
+      elif field.endswith('_s'): floor = floor_s
+      else: continue
+      if not base.get(field) or result[field] - base[field] < floor: continue
+      if result[field] > base[field] * (1 + tolerance):
+        drifts.append('%s: %s slower %s -> %s (%+.0f%%)' % (
+          name, field, base[field], result[field], (result[field] / base[field] - 1) * 100))
+  if changes == 0: print('no changes against baseline')
+  if drifts: print('timing drift (not counted as a change):\n  ' + '\n  '.join(drifts))
+  return changes
+
+# MAIN
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Gakusei benchmark suite')
+  parser.add_argument('--baseline', default='bench_baseline.json', help='results file to compare against')
+  parser.add_argument('--save', action='store_true', help='store results as the new baseline')
+  parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before a timing is reported')
+  parser.add_argument('--floor-us', type=float, default=5.0, help='smallest slowdown of a call timing reported')
+  parser.add_argument('--floor-s', type=float, default=0.02, help='smallest slowdown of a search or perft time reported')
+  parser.add_argument('--depth', type=int, default=engine.max_depth, help='iterative deepening depth of searches')
+  parser.add_argument('--repeat', type=int, default=20, help='calls per timed function')
+  parser.add_argument('--memory', action='store_true', help='measure peak memory of every search')
+  parser.add_argument('--no-perft', action='store_true', help='skip legal move tree counts')
+  parser.add_argument('--threads', type=int, nargs='+', help='compare search times for these process counts')
+  parser.add_argument('--batch', action='store_true', help='search with numpy batched leaf evaluation')
+  parser.add_argument('--leaves', action='store_true', help='compare scalar and batched leaf evaluation rates')
+  parser.add_argument('--clients', type=int, help='load test GTP server with this number of clients')
+  parser.add_argument('--client-moves', type=int, default=10, help='genmove commands of every load test client')
+  parser.add_argument('--workers', type=int, default=4, help='searches the load tested server runs at the same time')
+  parser.add_argument('--check', action='store_true', help='check numpy evaluation and SGF loading')
+  parser.add_argument('--board', choices=sorted(gakusei.backends), default='list', help='board backend to benchmark')
+  args = parser.parse_args()
+  engine.set_backend(args.board)
+  position = engine.position
+  engine.max_depth = args.depth
+  engine.batch_leaves = args.batch
+  if args.threads:
+    scaling(args.threads)
+    sys.exit()
+  if args.check: sys.exit(1 if check_numpy() + check_sgf() else 0)
+  if args.clients:
+    load_test(args.clients, args.client_moves, args.depth, args.workers)
+    sys.exit()
+  results = run(args)
+  if resource is not None:
+    print('peak resident memory %dKB' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+  if args.save:
+    with open(args.baseline, 'w') as file: json.dump(results, file, indent=2, sort_keys=True)
+    print('baseline saved to', args.baseline)
+  else:
+    try:
+      with open(args.baseline) as file: baseline = json.load(file)
+    except FileNotFoundError:
+      print('no baseline at', args.baseline, '- run with --save to create one')
+      sys.exit()
+    sys.exit(1 if compare(results, baseline, args.tolerance, args.floor_us, args.floor_s) else 0)
@@ -4,10 +4,24 @@
 #                                                                             #
 ###############################################################################
 
+import os
 import sys
 import copy
+import asyncio
+import json
+import mmap
+import time
 import random
-from copy import deepcopy
+import struct
+import argparse
+import functools
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
+
+try: import numpy
+except ImportError: numpy = None
 
 # GLOBAL CONSTANTS
 NONE = -1                   # value of not initialized variable
@@ -18,14 +32,48 @@ FENCE = 3                   # offboard value
 STONE = 4                   # any stone value, including EMPTY
 SOLVE = 5                   # pattern response value
 ESCAPE = 6                  # liberty mask value
+EXACT = 0                   # transposition table score is exact
+LOWER = 1                   # transposition table score is a lower bound
+UPPER = 2                   # transposition table score is an upper bound
+SERVER_REFUSED = (          # GTP commands refused to server sessions: they need a background
+  'gakusei-analyze',        # thread, change settings of the whole process or open files
+  'gakusei-ponder',         # on the server
+  'gakusei-threads',
+  'gakusei-tt_size',
+  'gakusei-book',
+  'loadsgf'
+)
+
+# GLOBAL VARIABLES          # shared by every game played in the process
+pool_alpha = None           # best root score found so far, shared by worker processes
+worker_engine = None        # engine of a worker process, reused by its root move searches
+stats = {}                  # instrumented method name -> [calls, seconds including nested calls]
+originals = {}              # (position class, instrumented method name) -> method its wrapper replaced
+tables = {}                 # board width -> board tables, built once for every board size
+setup_batch = 32            # queued GTP moves applied by a single setup() rather than one play() each
+
+# POSITION BOOK             # file header and fixed size record of a searched root result
+book_header = struct.Struct('<4sI8x')   # magic, number of record slots
+book_record = struct.Struct('<QBBhhBx') # position key, width, side to move, move square, score, depth
+
+# INSTRUMENTED METHODS      # replaced by timing wrappers while statistics are on, untouched otherwise
+instrumented = [
+  'genmove', 'big_moves', 'attack', 'defend', 'check_ladder',
+  'match_pattern', 'update_groups', 'play', 'evaluate'
+]
+
+# INFLUENCE WEIGHTS         # (row offset, col offset, weight) in the order squares are read
+influence_weights = [
+  (0, 0, 60), (0, 1, 13), (0, -1, 13), (0, 2, 5), (0, -2, 5), (0, 3, 1), (0, -3, 1),
+  (1, 0, 13), (1, 1, 6), (1, -1, 6), (1, 2, 2), (1, -2, 2),
+  (-1, 0, 13), (-1, 1, 6), (-1, -1, 6), (-1, 2, 2), (-1, -2, 2),
+  (2, 0, 5), (2, 1, 1), (2, -1, 1), (2, 2, 1), (2, -2, 1),
+  (-2, 0, 5), (-2, 1, 1), (-2, -1, 1), (-2, 2, 1), (-2, -2, 1),
+  (3, 0, 1), (-3, 0, 1)
+]
 
-# GLOBAL VARIABLES
-width = NONE                # board width (9, 13, 19 or other)
-board = [[]]                # board position, two dimensional array
-side = NONE                 # side to move, either BLACK or WHITE
-ko = [NONE, NONE]           # [col, row] Ko square, cannot set a stone on it
-groups = []                 # black and white groups database
-best_move = NONE            # best move after search
+# PATTERN LOOKUP TABLE      # 3x3 neighbourhood code -> (pattern index, response row, response col, urgency weight)
+pattern_table = {}
 
 # PATTERN DATABASE          # "$" is SOLVE, "." is EMPTY, "X" = BLACK, "O" is WHITE, "?" is STONE, ~ is FENCE
 patterns= [
@@ -71,230 +119,79 @@ patterns= [
   ]
 ]
 
-def init_board():
-  '''
-  Initializes board array of a given size with zeros,
-  sets the side to move, resets a Ko square,
-  clears groups database
-  '''
-  global board, side, ko, groups
-  board = [[0 for _ in range(width)] for _ in range(width)]
-  for row in range(width):
-    for col in range(width):
-      if row == 0 or row == width-1 or col == 0 or col == width-1:
-        board[row][col] = FENCE
-  side = BLACK
-  ko = [NONE, NONE]
-  groups = [[], []]
-
-def print_board():
-  '''
-  Prints the board and game state to STDOUT,
-  used for debugging and by GTP command "showboard"
-  '''
-  for row in range(width):
-    for col in range(width):
-      if col == 0 and row != 0 and row != width-1:
-        rown = width-row-1
-        print((' ' if rown < 10 else ''), rown, end=' ')
-      if board[row][col] == FENCE: continue
-      if col == ko[0] and row == ko[1]: print('#', end=' ')
-      else: print(['.', 'X', 'O', '#'][board[row][col]], end=' ')
-    if row < width-1: print()
-  print('   ', 'A B C D E F G H J K L M N O P Q R S T'[:width*2-4])
-  print('\n    Side to move:', ('BLACK' if side == 1 else 'WHITE'), file=sys.stderr)
-  print()
-
-def print_groups():
-  '''
-  Prints board group data structures
-  '''
-  print('    Black groups:')
-  for group in groups[BLACK-1]: print('      ', group)
-  print('\n    White groups:')
-  for group in groups[WHITE-1]: print('      ', group)
-  print()
-
-def count(col, row, color, marks):
-  '''
-  Finds all stones of a given color connected to to the
-  current stone at board[row][col], marks stones and liberties
-  in a corresponding array which is essentially a helper board
-  '''
-  stone = board[row][col]
-  if stone == FENCE: return
-  if stone and (stone & color) and marks[row][col] == EMPTY:
-    marks[row][col] = stone
-    count(col+1, row, color, marks)
-    count(col-1, row, color, marks)
-    count(col, row+1, color, marks)
-    count(col, row-1, color, marks)
-  elif stone == EMPTY:
-    marks[row][col] = ESCAPE
-
-def add_stones(marks, color):
-  '''
-  Extracts stone/liberty coordinate pairs and stores them as group
-  '''
-  group = {'stones': [], 'liberties' :[]}
-  for row in range(width):
-    for col in range(width):
-      stone = marks[row][col]
-      if stone == FENCE or stone == EMPTY: continue
-      if stone == ESCAPE: group['liberties'].append((col, row))
-      else: group['stones'].append((col, row))
-  return group
-
-def make_group(col, row, color):
+def init_tables(width):
   '''
-  Returns a group of a given color at col, row
+  Returns neighbour, diagonal, influence, influence reader,
+  zobrist and pattern code tables for a given board width,
+  along with 3x3 codes and influence of the empty board and
+  positional parts of move urgencies, they are
+  built once and shared by every position of that width,
+  influence reads follow the two dimensional board they
+  were designed for: a read past the last row or column
+  stops the scan and a negative index wraps around to
+  the opposite side
   '''
-  marks = [[EMPTY for _ in range(width)] for _ in range(width)]
-  count(col, row, color, marks)
-  return add_stones(marks, color)
-
-def update_groups():
-  '''
-  Keeps track of BLACK and WHITE groups on board by
-  maintaining coordinates of stones and their liberties
-  '''
-  global groups
-  groups = [[], []]
-  for row in range(width):
-    for col in range(width):
-      stone = board[row][col]
-      if stone == FENCE or stone == EMPTY: continue
-
-      if stone == BLACK:
-        group = make_group(col, row, BLACK)
-        if group not in groups[BLACK-1]: groups[BLACK-1].append(group)
-      if stone == WHITE:
-        group = make_group(col, row, WHITE)
-        if group not in groups[WHITE-1]: groups[WHITE-1].append(group)
-
-def is_clover(col, row):
-  '''
-  Returns color of clover shape surrounding current square
-  or EMPTY if this is not a clover shape
-  '''
-  clover_color = -1
-  other_color = -1
-  for stone in [board[row][col+1], board[row][col-1], board[row+1][col], board[row-1][col]]:
-    if stone == FENCE: continue
-    if stone == EMPTY: return EMPTY
-    if clover_color == -1:
-      clover_color = stone
-      other_color = (3-clover_color)
-    elif stone == other_color: return EMPTY
-  return clover_color
-
-def is_suicide(col, row, color):
-  '''
-  Checks if the stone of a given color placed at col, row
-  would result in group self capture, returns true if
-  so and false otherwise
-  '''
-  suicide = False
-  board[row][col] = color
-  marks = [[EMPTY for _ in range(width)] for _ in range(width)]
-  count(col, row, color, marks)
-  group = add_stones(marks, color)
-  if len(group['liberties']) == 0: suicide = True
-  board[row][col] = EMPTY
-  return suicide
-
-def is_atari(col, row, color):
-  '''
-  Checks if the stone of a given color placed at col, row
-  is in atari, returns true if so and false otherwise
-  '''
-  atari = False
-  board[row][col] = color
-  marks = [[EMPTY for _ in range(width)] for _ in range(width)]
-  count(col, row, color, marks)
-  group = add_stones(marks, color)
-  if len(group['liberties']) == 1: atari = True
-  board[row][col] = EMPTY
-  return atari
-
-def get_influence(col, row):
-  '''
-  Calculates influence at col, row -
-  the less uncrowded part of the board is
-  the bigger influence value is returned
-  '''
-  influence = 0
-  try:
-    if board[row][col]     == EMPTY: influence += 60
-    if board[row][col+1]   == EMPTY: influence += 13
-    if board[row][col-1]   == EMPTY: influence += 13
-    if board[row][col+2]   == EMPTY: influence += 5
-    if board[row][col-2]   == EMPTY: influence += 5
-    if board[row][col+3]   == EMPTY: influence += 1
-    if board[row][col-3]   == EMPTY: influence += 1
-    if board[row+1][col]   == EMPTY: influence += 13
-    if board[row+1][col+1] == EMPTY: influence += 6
-    if board[row+1][col-1] == EMPTY: influence += 6
-    if board[row+1][col+2] == EMPTY: influence += 2
-    if board[row+1][col-2] == EMPTY: influence += 2
-    if board[row-1][col]   == EMPTY: influence += 13
-    if board[row-1][col+1] == EMPTY: influence += 6
-    if board[row-1][col-1] == EMPTY: influence += 6
-    if board[row-1][col+2] == EMPTY: influence += 2
-    if board[row-1][col-2] == EMPTY: influence += 2
-    if board[row+2][col]   == EMPTY: influence += 5
-    if board[row+2][col+1] == EMPTY: influence += 1
-    if board[row+2][col-1] == EMPTY: influence += 1
-    if board[row+2][col+2] == EMPTY: influence += 1
-    if board[row+2][col-2] == EMPTY: influence += 1
-    if board[row-2][col]   == EMPTY: influence += 5
-    if board[row-2][col+1] == EMPTY: influence += 1
-    if board[row-2][col-1] == EMPTY: influence += 1
-    if board[row-2][col+2] == EMPTY: influence += 1
-    if board[row-2][col-2] == EMPTY: influence += 1
-    if board[row+3][col]   == EMPTY: influence += 1
-    if board[row-3][col]   == EMPTY: influence += 1
-  except: pass
-  return influence
-
-def play(col, row, color):
-  '''
-  Sets stone of a given color at col, row,
-  handles captures, sets new Ko square when needed.
-  '''
-  global ko, side
-  ko = [NONE, NONE]
-  board[row][col] = color
-  update_groups()
-  for group in groups[(3-color-1)]:
-    if len(group['liberties']) == 0:
-      if len(group['stones']) == 1 and is_clover(col, row) == (3-color):
-        ko = group['stones'][0]
-      for stone in group['stones']:
-        board[stone[1]][stone[0]] = EMPTY
-  side = (3-color)
-
-def big_moves(color):
-  '''
-  Attempts to make a big move based on influence
-  '''
-  moves = []
-  rows = list(range(width))
-  cols = list(range(width))
-  for row in range(width):
-    for col in range(width):
-      if board[row][col] == FENCE: continue
-      if board[row][col] == EMPTY and (col, row) != ko and not is_suicide(col, row, color):
-        urgency = calculate_urgency('big_move', get_influence(col, row), (col, row))
-        if (col, row) in [(4,4), (4,width-5), (width-5,4), (width-5,width-5)]: urgency += 20
-        if (col, row) in [(4,width//2), (width//2,4), (width-5,width//2), (width//2,width-5)]: urgency += 10
-        if row == 3 or row == (width-4) or col == 3 or col == (width-4): urgency += 5
-        if not is_atari(col, row, color):
-          if not is_clover(col, row) != EMPTY:
-            moves.append([(col, row), urgency, 'big_move'])
-  moves.sort(key=lambda x: x[1], reverse=True)
-  if len(moves): return [moves[0]]
-  else: return []
+  if width not in tables:
+    size = width * width
+    table_neighbours = [()] * size
+    table_diagonals = [()] * size
+    table_influence = [()] * size
+    table_code_updates = [()] * size
+    table_readers = [[] for _ in range(size)]
+    for row in range(1, width-1):
+      for col in range(1, width-1):
+        square = row * width + col
+        table_neighbours[square] = (square+1, square-1, square+width, square-width)
+        table_diagonals[square] = (square+width+1, square+width-1, square-width+1, square-width-1)
+        reads = []
+        for row_offset, col_offset, weight in influence_weights:
+          read_row, read_col = row + row_offset, col + col_offset
+          if read_row >= width or read_col >= width: break
+          reads.append(((read_row % width) * width + (read_col % width), weight))
+        table_influence[square] = tuple(reads)
+        for target, weight in reads: table_readers[target].append((square, weight))
+    table_readers = [tuple(readers) for readers in table_readers]
+    for square in range(size):
+      updates = []
+      for cell in range(9):
+        center = square - (cell // 3 - 1) * width - (cell % 3 - 1)
+        if 0 < center // width < width-1 and 0 < center % width < width-1:
+          updates.append((center, 2 * cell))
+      table_code_updates[square] = tuple(updates)
+    keys = random.Random(width)
+    table_zobrist = [[keys.getrandbits(64) for _ in range(size)] for _ in range(3)]
+    table_zobrist.append(keys.getrandbits(64))
+    fence = [row in (0, width-1) or col in (0, width-1) for row in range(width) for col in range(width)]
+    table_empty_codes = [0] * size
+    for square in range(size):
+      if fence[square]:
+        for center, shift in table_code_updates[square]: table_empty_codes[center] += FENCE << shift
+    table_empty_influence = [sum(weight for read, weight in reads if not fence[read]) for reads in table_influence]
+    table_big_bonus = [width] * size
+    table_pattern_urgency = [0] * size
+    table_save_urgency = [0] * size
+    for square in range(size):
+      row, col = divmod(square, width)
+      if (col, row) in [(4,4), (4,width-5), (width-5,4), (width-5,width-5)]: table_big_bonus[square] += 20
+      if (col, row) in [(4,width//2), (width//2,4), (width-5,width//2), (width//2,width-5)]: table_big_bonus[square] += 10
+      if row == 3 or row == (width-4) or col == 3 or col == (width-4): table_big_bonus[square] += 5
+      table_pattern_urgency[square] = (width*21) - abs(col - width//4) - abs(row - width//4)
+      table_save_urgency[square] = (width*37) - abs(col - width//2) - abs(row - width//2)
+    table_levels = max(bonus + value for bonus, value in zip(table_big_bonus, table_empty_influence)) + 1
+    table_reads = table_scale = None
+    if numpy is not None:
+      table_reads = numpy.zeros((size, len(influence_weights)), dtype=numpy.intp)
+      table_scale = numpy.zeros((size, len(influence_weights)), dtype=numpy.int32)
+      for square in range(size):
+        for read, (target, weight) in enumerate(table_influence[square]):
+          table_reads[square, read] = target
+          table_scale[square, read] = weight
+    tables[width] = (
+      table_neighbours, table_diagonals, table_influence, table_readers, table_zobrist,
+      table_code_updates, table_empty_codes, table_empty_influence, table_reads, table_scale,
+      table_big_bonus, table_pattern_urgency, table_save_urgency, table_levels
+    )
+  return tables[width]
 
 def rotate_pattern(pattern):
   '''
@@ -330,319 +227,1963 @@ def make_patterns():
         all_patterns.append(pat)
   return all_patterns
 
-def board_to_3x3_patterns():
-  '''
-  Returns board as a list of 3x3 patterns for matching purposes
-  '''
-  board_patterns = []
-  blen = len(board)
-  if blen < 3: raise ValueError("The array must be at least 3x3 in size.")
-  for row in range(blen - 2):
-    for col in range(blen - 2):
-      board_patterns.append([(col, row), [prow[col:col+3] for prow in board[row:row+3]]])
-  return board_patterns
-
-def match_pattern(color):
-  '''
-  Returns a list of pattern matching moves on board
-  '''
-  pattern_moves = []
-  for mpat in make_patterns():
-    for bpat in board_to_3x3_patterns():
-      is_match = True
-      response = ()
-      for row in range(3):
-        for col in range(3):
-          if mpat[row][col] == SOLVE:
-            response = (bpat[0][0] + col, bpat[0][1] + row)
-            if board[response[1]][response[0]] != EMPTY: is_match = False
-          elif mpat[row][col] != SOLVE and mpat[row][col] != STONE:
-            if mpat[row][col] != bpat[1][row][col]: is_match = False
-      if is_match:
-        urgency = calculate_urgency('pattern', mpat, response)
-        if not is_suicide(response[0], response[1], color):
-          if not is_atari(response[0], response[1], color):
-            if not is_clover(response[0], response[1]):
-              pattern_moves.append([response, urgency, 'pattern'])
-
-  pattern_moves.sort(key=lambda x: x[1])
-  return pattern_moves
-
-def is_ladder(col, row, color, first_run):
-  '''
-  Resursively simulates a ladder chasing and
-  figures out whether it works or not
-  '''
-  group = make_group(col, row, color)
-  if len(group['liberties']) == 0: return 1
-  if len(group['liberties']) == 1:
-    if board[row][col] != EMPTY and first_run == False:
-      if len(group['liberties']) <= 1: return 1
-      else: return 0
-    board[row][col] = color
-    new_col = group['liberties'][0][0]
-    new_row = group['liberties'][0][1]
-    if is_ladder(new_col, new_row, color, False): return 1
-    board[row][col] = EMPTY
-  if len(group['liberties']) == 2:
-    for move in group['liberties']:
-      board[move[1]][move[0]] = (3-color)
-      group = make_group(col, row, color)
-      new_col = group['liberties'][0][0]
-      new_row = group['liberties'][0][1]
-      if is_ladder(new_col, new_row, color, False): return move
-      board[move[1]][move[0]] = EMPTY
-  return 0
-
-def check_ladder(col, row, color):
-  '''
-  Return true if ladder is working and false otherwise,
-  initial group to check should contain 2 liberties
-  '''
-  global board
-  current_board = copy.deepcopy(board)
-  ladder = is_ladder(col, row, color, True)
-  board = copy.deepcopy(current_board)
-  return ladder
-
-def attack(group, color):
-  '''
-  Returns the best move to attack a given group
+def compile_patterns():
   '''
-  moves = []
-  surround_moves = []
-  if len(group['liberties'])== 1: # capture group
-    if group['liberties'][0] != ko:
-      urgency = calculate_urgency('capture', group, group['liberties'][0])
-      moves.append([group['liberties'][0], urgency, 'capture'])
-  if len(group['liberties']) == 2: # check ladder attack
-    stone = group['stones'][0]
-    move = check_ladder(stone[0], stone[1], (3-color))
-    if move:
-      if not is_suicide(move[0], move[1], color):
-        if not is_atari(move[0], move[1], color):
-          urgency = calculate_urgency('ladder', group, move)
-          moves.append([move, urgency, 'ladder_attack'])
-  if len(moves):
-    moves.sort(key=lambda x: x[1])
-    return moves
-  return []
+  Builds pattern lookup table keyed by 3x3 neighbourhood
+  code of the pattern center, STONE squares are expanded
+  to every value they match, SOLVE squares must be EMPTY,
+  weight of the pattern is summed once for its urgency
+  '''
+  global pattern_table
+  pattern_table = {}
+  for index, pattern in enumerate(make_patterns()):
+    weight = sum(sum(row) for row in pattern) * 4
+    values = []
+    for row in range(3):
+      for col in range(3):
+        if pattern[row][col] == SOLVE:
+          values.append([EMPTY])
+          response = (row-1, col-1)
+        elif pattern[row][col] == STONE: values.append([EMPTY, BLACK, WHITE, FENCE])
+        else: values.append([pattern[row][col]])
+    for stones in itertools.product(*values):
+      code = sum(stone << (2 * cell) for cell, stone in enumerate(stones))
+      pattern_table.setdefault(code, []).append((index, response[0], response[1], weight))
 
-def defend(group, color):
+def tt_order(moves, tt_move):
   '''
-  Returns the best move to defend a given group
+  Moves transposition table best move to the front
   '''
-  moves = []
-  extend_moves = []
-  urgency = int(len(group['stones']) / len(group['liberties']))
-  if len(group['liberties'])== 1: # save group
-    if not is_suicide(group['liberties'][0][0], group['liberties'][0][1], color):
-      urgency = calculate_urgency('save', group, group['liberties'][0])
-      stone = group['stones'][0]
-      ladder = check_ladder(stone[0], stone[1], color) # check if not trapped into a ladder
-      if not ladder: moves.append([group['liberties'][0], urgency, 'save'])
-  if len(extend_moves):
-    extend_moves.sort(key=lambda x: x[1])
-    moves.append(extend_moves[0])
-  if len(moves):
-    moves.sort(key=lambda x: x[1], reverse=True)
-    return moves
-  return []
-
-def calculate_urgency(move_type, group, move):
-  '''
-  Returns urgency value based on group size
-  and amount of its liberties, move type and location
-  '''
-  if move_type == 'big_move': return (width)+group
-  elif move_type == 'pattern':
-    center = (width // 4, width // 4)
-    distance = abs(move[0] - center[0]) + abs(move[1] - center[1])
-    weight = 0
-    for row in group:
-      for col in row: weight += col
-    return (width*21)-distance+weight*4
-  else:
-    center = (width // 2, width // 2)
-    distance = abs(move[0] - center[0]) + abs(move[1] - center[1])
-    urgency = int(len(group['stones']) / len(group['liberties']))
-    if move_type == 'capture': urgency += (width*37)
-    elif move_type == 'ladder': urgency += (width*25)
-    elif move_type == 'save': urgency += ((width*37)-distance)
-    return urgency
+  for index in range(len(moves)):
+    if moves[index][0] == tt_move: return [moves[index]] + moves[:index] + moves[index+1:]
+  return moves
 
-def genmove(color):
+def unique(moves):
+  '''
+  Filters duplicate moves
+  '''
+  seen_squares = set()
+  unique = []
+  for move in moves:
+    if move[0] in seen_squares: continue
+    seen_squares.add(move[0])
+    unique.append(move)
+  return unique
+
+def read_sgf(file, chunk_size=1 << 16):
+  '''
+  Streaming SGF parser, reads file in chunks and yields
+  every game of the collection as the list of nodes of
+  its main line, node is a dictionary of property ->
+  list of values, other variations are skipped
+  '''
+  depth = 0
+  nodes = []
+  node = {}
+  ident = ''
+  prop = ''
+  value = None
+  escape = False
+  done = False
+  while True:
+    chunk = file.read(chunk_size)
+    if not chunk: break
+    for char in chunk:
+      if value is not None:
+        if escape: value.append(char); escape = False
+        elif char == '\\': escape = True
+        elif char == ']':
+          if not done: node.setdefault(prop, []).append(''.join(value))
+          value = None
+        else: value.append(char)
+      elif char == '[':
+        if ident: prop, ident = ident, ''
+        value = []
+      elif char == ';':
+        if not done:
+          node = {}
+          nodes.append(node)
+      elif char == '(': depth += 1
+      elif char == ')':
+        depth -= 1
+        if depth == 0:
+          if nodes: yield nodes
+          nodes, done = [], False
+        else: done = True # main line ends with the first variation closed
+      elif 'A' <= char <= 'Z': ident += char
+
+def sgf_square(value, width):
+  '''
+  Converts SGF point to board square, NONE for pass
+  '''
+  if value == '' or (value == 'tt' and width <= 19+2): return NONE
+  return (ord(value[1]) - ord('a') + 1) * width + (ord(value[0]) - ord('a') + 1)
+
+def sgf_moves(game, width, limit=None):
   '''
-  Returns list of moves sorted by its "urgency", it's
-  used for move ordering within alpha beta search.
+  Returns (color, square) moves setting up a position of
+  SGF game before a given move number, setup stones of the
+  nodes before that move included, "PL" turns into a pass
+  of the other side
   '''
-  
-  update_groups()
   moves = []
+  played = 0
+  for node in game:
+    if limit is not None and played >= limit and ('B' in node or 'W' in node): break
+    for prop, color in (('AB', BLACK), ('AW', WHITE)):
+      for value in node.get(prop, []): moves.append((color, sgf_square(value, width)))
+    for prop, color in (('B', BLACK), ('W', WHITE)):
+      if prop not in node: continue
+      moves.append((color, sgf_square(node[prop][0], width)))
+      played += 1
+    if 'PL' in node: moves.append((WHITE if node['PL'][0].upper().startswith('B') else BLACK, NONE))
+  return moves
+
+def sgf_width(game):
+  '''
+  Returns board width of SGF game, 19x19 if not given
+  '''
+  return int(game[0].get('SZ', ['19'])[0].split(':')[0]) + 2
+
+def bit_squares(bits):
+  '''
+  Returns sorted squares of bits set in a bitboard
+  '''
+  squares = []
+  while bits:
+    low = bits & -bits
+    squares.append(low.bit_length() - 1)
+    bits ^= low
+  return squares
+
+class Position:
+  '''
+  Board position of a single game: stones, chains, Ko square,
+  side to move, undo history and zobrist key, along with the
+  tables of its board width, methods read and change it
+  '''
+  __slots__ = (
+    'width', 'board', 'side', 'ko', 'groups', 'chains', 'history', 'stones_key', 'codes',
+    'influence_values', 'score', 'ladder_cache', 'ladder_watch', 'ladder_steps', 'use_numpy',
+    'neighbours', 'diagonals', 'influence', 'influence_readers', 'zobrist', 'code_updates',
+    'empty_codes', 'empty_influence', 'influence_reads', 'influence_scale',
+    'big_bonus', 'pattern_urgency', 'save_urgency', 'urgency_levels', 'urgency_buckets', 'urgency_of',
+    'urgency_dirty'
+  )
+  backend = 'list'
+
+  def __init__(self, width=19+2):
+    self.ladder_steps = 1000                # ladder reading gives up after that many chaser moves
+    self.use_numpy = False                  # evaluate influence with numpy from scratch instead of the influence map
+    self.ladder_cache = {}                  # (stone, color) -> ladder reading result
+    self.ladder_watch = {}                  # square -> ladder cache keys read from it
+    self.init_board(width)
+
+  def init_board(self, width=None):
+    '''
+    Initializes board array of a given width with zeros,
+    sets the side to move, resets a Ko square,
+    clears groups database
+    '''
+    if width is not None: self.width = width
+    width = self.width
+    (self.neighbours, self.diagonals, self.influence, self.influence_readers, self.zobrist, self.code_updates,
+     self.empty_codes, self.empty_influence, self.influence_reads, self.influence_scale,
+     self.big_bonus, self.pattern_urgency, self.save_urgency, self.urgency_levels) = init_tables(width)
+    board = self.board = bytearray(width * width)
+    for row in range(width):
+      for col in range(width):
+        if row == 0 or row == width-1 or col == 0 or col == width-1:
+          board[row * width + col] = FENCE
+    self.side = BLACK
+    self.ko = NONE
+    self.rebuild()
+
+  def rebuild(self):
+    '''
+    Computes chains, 3x3 codes, influence map, big move
+    urgency buckets, evaluation score and zobrist key of the
+    stones on board from scratch, clears groups, ladder
+    cache and history
+    '''
+    width = self.width
+    board = self.board
+    neighbours = self.neighbours
+    size = width * width
+    self.ladder_cache.clear()
+    self.ladder_watch.clear()
+    self.groups = [[], []]
+    self.history = []
+    chains = self.chains = [None] * size
+    for square in range(size):
+      color = board[square]
+      if (color != BLACK and color != WHITE) or chains[square] is not None: continue
+      chain = {'color': color, 'stones': [square], 'liberties': set()}
+      chains[square] = chain
+      for stone in chain['stones']:
+        for neighbour in neighbours[stone]:
+          if board[neighbour] == EMPTY: chain['liberties'].add(neighbour)
+          elif board[neighbour] == color and chains[neighbour] is None:
+            chains[neighbour] = chain
+            chain['stones'].append(neighbour)
+    codes = self.codes = list(self.empty_codes)
+    values = self.influence_values = list(self.empty_influence)
+    stones = [square for square in range(size) if board[square] == BLACK or board[square] == WHITE]
+    for square in stones:
+      for center, shift in self.code_updates[square]: codes[center] += board[square] << shift
+      for reader, weight in self.influence_readers[square]: values[reader] -= weight
+    bonus = self.big_bonus
+    buckets = self.urgency_buckets = [set() for _ in range(self.urgency_levels)]
+    urgency_of = self.urgency_of = [NONE] * size
+    self.urgency_dirty = set()
+    for square in range(size):
+      if board[square] != EMPTY: continue
+      urgency_of[square] = bonus[square] + values[square]
+      buckets[urgency_of[square]].add(square)
+    self.stones_key = 0
+    self.score = 0
+    for square in stones:
+      if board[square] == BLACK: self.score += 60 + values[square]
+      else: self.score += values[square] - 60
+      self.stones_key ^= self.zobrist[board[square]][square]
+
+  def load(self, stones, color, ko_square):
+    '''
+    Sets up position from bytes of the board array,
+    side to move and Ko square, history is cleared
+    '''
+    self.board = bytearray(stones)
+    self.rebuild()
+    self.side = color
+    self.ko = ko_square
+
+  def setup(self, moves):
+    '''
+    Applies a sequence of (color, square) moves at once, square
+    is NONE for pass: stones are set and captures resolved on
+    the board array alone, chains and everything derived from
+    the board are then rebuilt once for the whole sequence,
+    history is cleared
+    '''
+    board = self.board
+    neighbours = self.neighbours
+    def captured_chain(square):
+      stones = [square]
+      seen = {square}
+      for stone in stones:
+        for neighbour in neighbours[stone]:
+          if board[neighbour] == EMPTY: return None
+          if board[neighbour] == board[square] and neighbour not in seen:
+            seen.add(neighbour)
+            stones.append(neighbour)
+      return stones
+    for color, square in moves:
+      self.ko = NONE
+      self.side = (3-color)
+      if square == NONE: continue
+      board[square] = color
+      captured = []
+      for neighbour in neighbours[square]:
+        if board[neighbour] != (3-color) or any(neighbour in chain for chain in captured): continue
+        chain = captured_chain(neighbour)
+        if chain is not None: captured.append(chain)
+      captured.sort(key=min)
+      for chain in captured:
+        if len(chain) == 1 and self.is_clover(square) == (3-color): self.ko = chain[0]
+        for stone in chain: board[stone] = EMPTY
+    ko = self.ko
+    self.rebuild()
+    self.ko = ko
+
+  def handicap(self, count):
+    '''
+    Returns squares of fixed handicap stones in the order
+    GTP places them, empty list if the count is not
+    allowed for the board size
+    '''
+    size = self.width - 2
+    if size < 7 or count < 2 or count > (9 if size % 2 and size > 7 else 4): return []
+    low = 4 if size >= 13 else 3
+    high = size + 1 - low
+    middle = (size + 1) // 2
+    points = [(low, low), (high, high), (low, high), (high, low)][:count]
+    if count >= 6: points += [(low, middle), (high, middle)]
+    if count >= 8: points += [(middle, low), (middle, high)]
+    if count >= 5 and count % 2: points.append((middle, middle))
+    return [(self.width - line - 1) * self.width + col for col, line in points]
+
+  def board_string(self):
+    '''
+    Returns the board as text, used by GTP command "showboard"
+    '''
+    width = self.width
+    lines = ['']
+    for row in range(1, width-1):
+      rown = width-row-1
+      line = (' ' if rown < 10 else '') + ' ' + str(rown) + ' '
+      for col in range(1, width-1):
+        square = row * width + col
+        if square == self.ko: line += '# '
+        else: line += ['.', 'X', 'O', '#'][self.board[square]] + ' '
+      lines.append(line)
+    lines.append('    ' + 'A B C D E F G H J K L M N O P Q R S T'[:width*2-4])
+    return '\n'.join(lines)
+
+  def print_board(self):
+    '''
+    Prints the board and game state to STDOUT,
+    used for debugging
+    '''
+    print(self.board_string())
+    print('\n    Side to move:', ('BLACK' if self.side == 1 else 'WHITE'), file=sys.stderr)
+    print()
+
+  def print_groups(self):
+    '''
+    Prints board group data structures
+    '''
+    print('    Black groups:')
+    for group in self.groups[BLACK-1]: print('      ', group)
+    print('\n    White groups:')
+    for group in self.groups[WHITE-1]: print('      ', group)
+    print()
+
+  def count(self, square, color, marks):
+    '''
+    Finds all stones of a given color connected to to the
+    current stone at board[square], marks stones and liberties
+    in a corresponding array which is essentially a helper board
+    '''
+    stone = self.board[square]
+    if stone == FENCE: return
+    if stone and (stone & color) and marks[square] == EMPTY:
+      marks[square] = stone
+      for neighbour in self.neighbours[square]: self.count(neighbour, color, marks)
+    elif stone == EMPTY:
+      marks[square] = ESCAPE
+
+  def add_stones(self, marks, color):
+    '''
+    Extracts stone/liberty squares and stores them as group
+    '''
+    group = {'stones': [], 'liberties' :[]}
+    for square in range(self.width * self.width):
+      stone = marks[square]
+      if stone == FENCE or stone == EMPTY: continue
+      if stone == ESCAPE: group['liberties'].append(square)
+      else: group['stones'].append(square)
+    return group
+
+  def make_group(self, square, color):
+    '''
+    Returns a group of a given color at square
+    '''
+    marks = bytearray(self.width * self.width)
+    self.count(square, color, marks)
+    return self.add_stones(marks, color)
+
+  def set_stone(self, square, stone):
+    '''
+    Sets square to a given stone, updates zobrist key,
+    3x3 codes, influence of squares reading it and the
+    evaluation score, marks squares reading it for big
+    move urgency update, drops ladder results read from
+    the square
+    '''
+    board = self.board
+    values = self.influence_values
+    old = board[square]
+    if old == BLACK: self.score -= 60 + values[square]
+    elif old == WHITE: self.score -= values[square] - 60
+    if (old == EMPTY) != (stone == EMPTY):
+      self.urgency_dirty.add(square)
+      board[square] = EMPTY
+      score = 0
+      if stone == EMPTY:
+        for reader, weight in self.influence_readers[square]:
+          values[reader] += weight
+          if 0 < board[reader] < 3: score += weight
+        self.score += score
+      else:
+        for reader, weight in self.influence_readers[square]:
+          values[reader] -= weight
+          if 0 < board[reader] < 3: score += weight
+        self.score -= score
+    board[square] = stone
+    if stone == BLACK: self.score += 60 + values[square]
+    elif stone == WHITE: self.score += values[square] - 60
+    if old != EMPTY: self.stones_key ^= self.zobrist[old][square]
+    if stone != EMPTY: self.stones_key ^= self.zobrist[stone][square]
+    codes = self.codes
+    for center, shift in self.code_updates[square]: codes[center] += (stone - old) << shift
+    if square in self.ladder_watch:
+      ladder_cache = self.ladder_cache
+      for key in self.ladder_watch.pop(square): ladder_cache.pop(key, None)
+
+  def add_stone(self, square, color):
+    '''
+    Places a stone of a given color at square and updates
+    chains around it: merges friendly chains, takes liberty
+    from enemy chains, returns enemy chains left without
+    liberties along with the data needed to undo the merge
+    '''
+    self.set_stone(square, color)
+    board = self.board
+    chains = self.chains
+    chain = {'color': color, 'stones': [square], 'liberties': set()}
+    merged = [chain]
+    enemies = []
+    for neighbour in self.neighbours[square]:
+      stone = board[neighbour]
+      if stone == EMPTY: chain['liberties'].add(neighbour)
+      elif stone == color:
+        friend = chains[neighbour]
+        if not any(friend is other for other in merged): merged.append(friend)
+      elif stone == (3-color):
+        enemy = chains[neighbour]
+        if not any(enemy is other for other in enemies):
+          enemy['liberties'].discard(square)
+          enemies.append(enemy)
+    merged.sort(key=lambda x: len(x['stones']), reverse=True)
+    base = merged[0]
+    merge = (base, len(base['stones']), set(base['liberties']), merged[1:])
+    for friend in merged[1:]:
+      for stone in friend['stones']: chains[stone] = base
+      base['stones'].extend(friend['stones'])
+      base['liberties'] |= friend['liberties']
+    base['liberties'].discard(square)
+    chains[square] = base
+    captured = [enemy for enemy in enemies if len(enemy['liberties']) == 0]
+    captured.sort(key=lambda x: min(x['stones']))
+    return captured, enemies, merge
+
+  def remove_chain(self, chain):
+    '''
+    Removes captured chain from board and gives
+    liberties back to the surrounding chains
+    '''
+    chains = self.chains
+    for square in chain['stones']:
+      self.set_stone(square, EMPTY)
+      chains[square] = None
+    for square in chain['stones']:
+      for neighbour in self.neighbours[square]:
+        other = chains[neighbour]
+        if other is not None: other['liberties'].add(square)
+
+  def restore_chain(self, chain):
+    '''
+    Puts captured chain back on board and takes its
+    stones from the liberties of the surrounding chains
+    '''
+    chains = self.chains
+    for square in chain['stones']:
+      self.set_stone(square, chain['color'])
+      chains[square] = chain
+    for square in chain['stones']:
+      for neighbour in self.neighbours[square]:
+        other = chains[neighbour]
+        if other is not None and other is not chain:
+          other['liberties'].discard(square)
+
+  def update_groups(self):
+    '''
+    Keeps track of BLACK and WHITE groups on board by
+    maintaining squares of stones and their liberties
+    '''
+    groups = self.groups = [[], []]
+    chains = self.chains
+    seen = set()
+    for square in range(self.width * self.width):
+      chain = chains[square]
+      if chain is None or id(chain) in seen: continue
+      seen.add(id(chain))
+      groups[chain['color']-1].append({
+        'stones': sorted(chain['stones']),
+        'liberties': sorted(chain['liberties'])
+      })
+
+  def is_clover(self, square):
+    '''
+    Returns color of clover shape surrounding current square
+    or EMPTY if this is not a clover shape
+    '''
+    clover_color = -1
+    other_color = -1
+    for neighbour in self.neighbours[square]:
+      stone = self.board[neighbour]
+      if stone == FENCE: continue
+      if stone == EMPTY: return EMPTY
+      if clover_color == -1:
+        clover_color = stone
+        other_color = (3-clover_color)
+      elif stone == other_color: return EMPTY
+    return clover_color
+
+  def count_liberties(self, square, color):
+    '''
+    Returns number of liberties, counted up to 2, the stone
+    of a given color placed at square would have, including
+    liberties of friendly chains it merges with and squares
+    of enemy stones it captures
+    '''
+    board = self.board
+    chains = self.chains
+    liberties = set()
+    friends = []
+    captured = []
+    for neighbour in self.neighbours[square]:
+      stone = board[neighbour]
+      if stone == EMPTY: liberties.add(neighbour)
+      elif stone == color: friends.append(chains[neighbour])
+      elif stone == (3-color) and len(chains[neighbour]['liberties']) == 1:
+        liberties.add(neighbour)
+        captured.append(chains[neighbour])
+    if len(liberties) >= 2: return 2
+    for friend in friends:
+      for liberty in friend['liberties']:
+        if liberty == square: continue
+        liberties.add(liberty)
+        if len(liberties) >= 2: return 2
+    for enemy in captured:
+      for stone in enemy['stones']:
+        for neighbour in self.neighbours[stone]:
+          if any(chains[neighbour] is friend for friend in friends):
+            liberties.add(stone)
+            if len(liberties) >= 2: return 2
+    return len(liberties)
 
-  # Generate big move
-  for move in big_moves(color):
-    if move not in moves:
-      moves.append(move)
+  def is_suicide(self, square, color):
+    '''
+    Checks if the stone of a given color placed at square
+    would result in group self capture, returns true if
+    so and false otherwise
+    '''
+    return self.count_liberties(square, color) == 0
 
-  # Generate attacking moves
-  for group in groups[(3-color-1)]: # attack opponent's weakest group
-    for move in attack(group, color):
-      if move != NONE and move not in moves:
+  def is_atari(self, square, color):
+    '''
+    Checks if the stone of a given color placed at square
+    is in atari, returns true if so and false otherwise
+    '''
+    return self.count_liberties(square, color) == 1
+
+  def get_influence(self, square):
+    '''
+    Calculates influence at square from scratch -
+    the less uncrowded part of the board is
+    the bigger influence value is returned,
+    influence_values keeps the same for every
+    square up to date
+    '''
+    board = self.board
+    value = 0
+    for read, weight in self.influence[square]:
+      if board[read] == EMPTY: value += weight
+    return value
+
+  def influence_map(self):
+    '''
+    Calculates influence of every square at once with numpy,
+    returns array indexed by square, values are the same
+    get_influence() returns for each square separately
+    '''
+    empty = numpy.frombuffer(self.board, dtype=numpy.uint8) == EMPTY
+    return (empty[self.influence_reads] * self.influence_scale).sum(axis=1)
+
+  def play(self, square, color):
+    '''
+    Sets stone of a given color at square,
+    handles captures, sets new Ko square when needed,
+    pushes undo record to the history stack
+    '''
+    old_ko = self.ko
+    old_side = self.side
+    self.ko = NONE
+    captured, enemies, merge = self.add_stone(square, color)
+    for chain in captured:
+      if len(chain['stones']) == 1 and self.is_clover(square) == (3-color):
+        self.ko = chain['stones'][0]
+      self.remove_chain(chain)
+    self.side = (3-color)
+    self.history.append((square, captured, enemies, merge, old_ko, old_side))
+
+  def undo(self):
+    '''
+    Takes back the last move played, restores
+    captured chains, Ko square and side to move
+    '''
+    square, captured, enemies, merge, old_ko, old_side = self.history.pop()
+    for chain in reversed(captured): self.restore_chain(chain)
+    base, length, liberties, friends = merge
+    del base['stones'][length:]
+    base['liberties'] = liberties
+    chains = self.chains
+    for friend in friends:
+      for stone in friend['stones']: chains[stone] = friend
+    for enemy in enemies: enemy['liberties'].add(square)
+    self.set_stone(square, EMPTY)
+    chains[square] = None
+    self.ko = old_ko
+    self.side = old_side
+
+  def position_key(self):
+    '''
+    Returns zobrist key of current position: stones
+    on board, Ko square and side to move
+    '''
+    key = self.stones_key
+    if self.ko != NONE: key ^= self.zobrist[EMPTY][self.ko]
+    if self.side == WHITE: key ^= self.zobrist[FENCE]
+    return key
+
+  def update_urgencies(self):
+    '''
+    Moves squares reading squares that became empty or
+    occupied since the last update to the urgency bucket
+    of their current big move urgency, occupied squares
+    leave the buckets
+    '''
+    board = self.board
+    values = self.influence_values
+    bonus = self.big_bonus
+    buckets = self.urgency_buckets
+    urgency_of = self.urgency_of
+    for square in self.urgency_dirty:
+      for reader, weight in self.influence_readers[square]:
+        urgency = bonus[reader] + values[reader] if board[reader] == EMPTY else NONE
+        if urgency == urgency_of[reader]: continue
+        if urgency_of[reader] != NONE: buckets[urgency_of[reader]].discard(reader)
+        if urgency != NONE: buckets[urgency].add(reader)
+        urgency_of[reader] = urgency
+    self.urgency_dirty.clear()
+
+  def big_moves(self, color):
+    '''
+    Attempts to make a big move based on influence, empty
+    squares are taken from urgency buckets most urgent
+    first until one of them is a playable move
+    '''
+    self.update_urgencies()
+    ko = self.ko
+    buckets = self.urgency_buckets
+    for urgency in range(len(buckets)-1, -1, -1):
+      if not buckets[urgency]: continue
+      for square in sorted(buckets[urgency]):
+        if square == ko or self.is_suicide(square, color) or self.is_atari(square, color): continue
+        if self.is_clover(square) == EMPTY: return [[square, urgency, 'big_move']]
+    return []
+
+  def match_pattern(self, color):
+    '''
+    Returns a list of pattern matching moves on board
+    '''
+    width = self.width
+    codes = self.codes
+    matches = []
+    for square in range(width * width):
+      if codes[square] not in pattern_table: continue
+      for index, row, col, weight in pattern_table[codes[square]]:
+        matches.append((index, square, square + row * width + col, weight))
+    matches.sort(key=lambda x: (x[0], x[1]))
+    pattern_moves = []
+    for index, square, response, weight in matches:
+      urgency = self.calculate_urgency('pattern', weight, response)
+      if not self.is_suicide(response, color):
+        if not self.is_atari(response, color):
+          if not self.is_clover(response):
+            pattern_moves.append([response, urgency, 'pattern'])
+
+    pattern_moves.sort(key=lambda x: x[1])
+    return pattern_moves
+
+  def extend_ladder(self, stones, liberties, square, color, placed, region):
+    '''
+    Returns stones and liberties of a chased group after it
+    extends to square, merging with stones of the same color
+    it touches, placed holds stones set while reading and
+    region collects squares the result depends on
+    '''
+    board = self.board
+    neighbours = self.neighbours
+    stones = stones | {square}
+    liberties = set(liberties)
+    liberties.discard(square)
+    region.add(square)
+    for neighbour in neighbours[square]:
+      region.add(neighbour)
+      stone = placed.get(neighbour, board[neighbour])
+      if stone == EMPTY: liberties.add(neighbour)
+      elif stone == color and neighbour not in stones:
+        chain = self.chains[neighbour]
+        stones |= set(chain['stones'])
+        for stone in chain['stones']: region.update(neighbours[stone])
+        for liberty in chain['liberties']:
+          if placed.get(liberty, board[liberty]) == EMPTY: liberties.add(liberty)
+    return stones, liberties
+
+  def read_ladder(self, stack, color, placed, region):
+    '''
+    Iteratively simulates a ladder chasing, every stack frame
+    holds stones and 2 liberties of a chased group, the next
+    liberty for the chaser to take and the square the group
+    has extended to, returns true if the group gets caught
+    '''
+    steps = 0
+    while stack:
+      frame = stack[-1]
+      stones, liberties, index, extension = frame
+      if index > 0: del placed[liberties[index-1]]
+      if index == 2:
+        stack.pop()
+        if extension != NONE: del placed[extension]
+        continue
+      frame[2] = index + 1
+      escape = liberties[1-index]
+      placed[liberties[index]] = (3-color)
+      placed[escape] = color
+      steps += 1
+      if steps > self.ladder_steps: return False
+      new_stones, new_liberties = self.extend_ladder(stones, [escape], escape, color, placed, region)
+      if len(new_liberties) <= 1: return True
+      if len(new_liberties) == 2: stack.append([new_stones, sorted(new_liberties), 0, escape])
+      else: del placed[escape]
+    return False
+
+  def check_ladder(self, square, color):
+    '''
+    Return true if ladder is working and false otherwise,
+    initial group to check should contain 2 liberties,
+    returns the chaser's first move for such a group,
+    results are cached until a square they were read
+    from changes
+    '''
+    key = (square, color)
+    if key in self.ladder_cache: return self.ladder_cache[key]
+    chain = self.chains[square]
+    liberties = sorted(chain['liberties'])
+    region = set(chain['stones'])
+    for stone in chain['stones']: region.update(self.neighbours[stone])
+    placed = {}
+    ladder = 0
+    if len(liberties) == 0: ladder = 1
+    elif len(liberties) == 1:
+      placed[liberties[0]] = color
+      stones, new_liberties = self.extend_ladder(set(chain['stones']), liberties, liberties[0], color, placed, region)
+      if len(new_liberties) <= 1: ladder = 1
+      elif len(new_liberties) == 2:
+        if self.read_ladder([[stones, sorted(new_liberties), 0, liberties[0]]], color, placed, region): ladder = 1
+    elif len(liberties) == 2:
+      stack = [[set(chain['stones']), liberties, 0, NONE]]
+      if self.read_ladder(stack, color, placed, region): ladder = liberties[stack[0][2]-1]
+    self.ladder_cache[key] = ladder
+    ladder_watch = self.ladder_watch
+    for read in region: ladder_watch.setdefault(read, set()).add(key)
+    return ladder
+
+  def attack(self, group, color):
+    '''
+    Returns the best move to attack a given group
+    '''
+    moves = []
+    surround_moves = []
+    if len(group['liberties'])== 1: # capture group
+      if group['liberties'][0] != self.ko:
+        urgency = self.calculate_urgency('capture', group, group['liberties'][0])
+        moves.append([group['liberties'][0], urgency, 'capture'])
+    if len(group['liberties']) == 2: # check ladder attack
+      move = self.check_ladder(group['stones'][0], (3-color))
+      if move:
+        if not self.is_suicide(move, color):
+          if not self.is_atari(move, color):
+            urgency = self.calculate_urgency('ladder', group, move)
+            moves.append([move, urgency, 'ladder_attack'])
+    if len(moves):
+      moves.sort(key=lambda x: x[1])
+      return moves
+    return []
+
+  def defend(self, group, color):
+    '''
+    Returns the best move to defend a given group
+    '''
+    moves = []
+    extend_moves = []
+    urgency = int(len(group['stones']) / len(group['liberties']))
+    if len(group['liberties'])== 1: # save group
+      if not self.is_suicide(group['liberties'][0], color):
+        urgency = self.calculate_urgency('save', group, group['liberties'][0])
+        ladder = self.check_ladder(group['stones'][0], color) # check if not trapped into a ladder
+        if not ladder: moves.append([group['liberties'][0], urgency, 'save'])
+    if len(extend_moves):
+      extend_moves.sort(key=lambda x: x[1])
+      moves.append(extend_moves[0])
+    if len(moves):
+      moves.sort(key=lambda x: x[1], reverse=True)
+      return moves
+    return []
+
+  def calculate_urgency(self, move_type, group, move):
+    '''
+    Returns urgency value based on group size
+    and amount of its liberties, move type and location,
+    group is influence of the square for big moves and
+    pattern weight for pattern moves, location parts
+    come from tables of the board width
+    '''
+    width = self.width
+    if move_type == 'big_move': return self.big_bonus[move]+group
+    elif move_type == 'pattern': return self.pattern_urgency[move]+group
+    else:
+      urgency = int(len(group['stones']) / len(group['liberties']))
+      if move_type == 'capture': urgency += (width*37)
+      elif move_type == 'ladder': urgency += (width*25)
+      elif move_type == 'save': urgency += self.save_urgency[move]
+      return urgency
+
+  def genmove(self, color):
+    '''
+    Returns list of moves sorted by its "urgency", it's
+    used for move ordering within alpha beta search.
+    '''
+
+    self.update_groups()
+    moves = []
+
+    # Generate big move
+    for move in self.big_moves(color):
+      if move not in moves:
         moves.append(move)
-  
-  # Generate defensive moves
-  for group in groups[(color-1)]: # defend own weakest group
-    for move in defend(group, color):
-      if move != NONE and move not in moves:
+
+    # Generate attacking moves
+    for group in self.groups[(3-color-1)]: # attack opponent's weakest group
+      for move in self.attack(group, color):
+        if move != NONE and move not in moves:
+          moves.append(move)
+
+    # Generate defensive moves
+    for group in self.groups[(color-1)]: # defend own weakest group
+      for move in self.defend(group, color):
+        if move != NONE and move not in moves:
+          moves.append(move)
+
+    # Generate pattern matches
+    for move in self.match_pattern(color):
+      if move not in moves:
         moves.append(move)
-  
-  # Generate pattern matches
-  for move in match_pattern(color):
-    if move not in moves:
-      moves.append(move)
-  
-  # Sort moves in place by urgency in descending order
-  if len(moves):
-    moves.sort(key=lambda x: x[1], reverse=True)
-    return unique(moves)[:-1] if len(moves) > 1 else moves
-  return []
 
-def unique(moves):
+    # Sort moves in place by urgency in descending order
+    if len(moves):
+      moves.sort(key=lambda x: x[1], reverse=True)
+      return unique(moves)[:-1] if len(moves) > 1 else moves
+    return []
+
+  def evaluate(self):
+    '''
+    Score position based on resulting influence,
+    the score is kept up to date by set_stone()
+    unless numpy is asked to recompute it
+    '''
+    if self.use_numpy:
+      stones = numpy.frombuffer(self.board, dtype=numpy.uint8)
+      values = self.influence_map()
+      black = stones == BLACK
+      white = stones == WHITE
+      score = int(values[black].sum() + values[white].sum()) + 60 * (int(black.sum()) - int(white.sum()))
+      return score if self.side == BLACK else -score
+    return self.score if self.side == BLACK else -self.score
+
+  def evaluate_boards(self, boards):
+    '''
+    Scores stacked boards of this width the way evaluate()
+    scores a single one, from black's point of view
+    '''
+    boards = boards.reshape(len(boards), -1)
+    stones = (boards == BLACK) | (boards == WHITE)
+    values = ((boards == EMPTY)[:, self.influence_reads] * self.influence_scale).sum(axis=2)
+    material = 60 * ((boards == BLACK).sum(axis=1) - (boards == WHITE).sum(axis=1))
+    return (values * stones).sum(axis=1) + material
+
+  def move_to_string(self, move):
+    '''
+    Convert move square to algebraic notation
+    '''
+    row, col = divmod(move, self.width)
+    col = chr(col-(1 if col<=8 else 0)+ord('A'))
+    row = str(self.width-row-1)
+    return col+row
+
+  def vertex_to_move(self, string):
+    '''
+    Returns square of GTP vertex, NONE if it is not
+    a point of the board
+    '''
+    letters = 'ABCDEFGHJKLMNOPQRSTUVWXYZ'[:self.width-2]
+    if len(string) < 2 or string[0] not in letters or not string[1:].isdigit(): return NONE
+    if not 1 <= int(string[1:]) <= self.width-2: return NONE
+    return self.string_to_move(string)
+
+  def string_to_move(self, string):
+    '''
+    Convert algebraic notation to move square
+    '''
+    col = ord(string[0])-ord('A')+(1 if ord(string[0]) <= ord('H') else 0)
+    row = self.width-int(string[1:])-1
+    return row * self.width + col
+
+class BitPosition(Position):
   '''
-  Filters duplicate moves
+  Position keeping black and white stones as big integer
+  bitboards over the padded board besides the board array,
+  groups, liberties and ladders are computed from them by
+  shifting and masking: dilate(chain) & empty
   '''
-  seen_tuples = set()
-  unique = []
-  for sublist in moves:
-    tuples_in_sublist = {item for item in sublist if isinstance(item, tuple)}
-    if tuples_in_sublist & seen_tuples: continue
-    seen_tuples.update(tuples_in_sublist)
-    unique.append(sublist)
-  return unique
+  __slots__ = ('black', 'white', 'playable')
+  backend = 'bits'
+
+  def rebuild(self):
+    '''
+    Rebuilds board data along with the bitboards
+    '''
+    Position.rebuild(self)
+    board = self.board
+    self.playable = self.black = self.white = 0
+    for square in range(self.width * self.width):
+      if board[square] != FENCE: self.playable |= 1 << square
+      if board[square] == BLACK: self.black |= 1 << square
+      elif board[square] == WHITE: self.white |= 1 << square
+
+  def set_stone(self, square, stone):
+    '''
+    Sets square to a given stone on board and bitboards
+    '''
+    Position.set_stone(self, square, stone)
+    bit = 1 << square
+    self.black &= ~bit
+    self.white &= ~bit
+    if stone == BLACK: self.black |= bit
+    elif stone == WHITE: self.white |= bit
 
-def root(depth, color):
+  def dilate(self, bits):
+    '''
+    Returns bits grown by one square in 4 directions
+    '''
+    width = self.width
+    return (bits | bits << 1 | bits >> 1 | bits << width | bits >> width) & self.playable
+
+  def flood(self, bits, mask):
+    '''
+    Returns bits grown within mask until they stop growing
+    '''
+    while True:
+      grown = self.dilate(bits) & mask
+      if grown == bits: return bits
+      bits = grown
+
+  def make_group(self, square, color):
+    '''
+    Returns a group of a given color at square
+    '''
+    own = self.black if color == BLACK else self.white
+    empty = self.playable & ~(self.black | self.white)
+    bit = 1 << square
+    if not own & bit: return {'stones': [], 'liberties': [square] if empty & bit else []}
+    chain = self.flood(bit, own)
+    return {'stones': bit_squares(chain), 'liberties': bit_squares(self.dilate(chain) & empty)}
+
+  def update_groups(self):
+    '''
+    Collects BLACK and WHITE groups by flooding
+    bitboards from their lowest stones
+    '''
+    groups = self.groups = [[], []]
+    empty = self.playable & ~(self.black | self.white)
+    for color, stones in ((BLACK, self.black), (WHITE, self.white)):
+      remaining = stones
+      while remaining:
+        chain = self.flood(remaining & -remaining, stones)
+        remaining &= ~chain
+        groups[color-1].append({'stones': bit_squares(chain), 'liberties': bit_squares(self.dilate(chain) & empty)})
+
+  def count_liberties(self, square, color):
+    '''
+    Returns number of liberties, counted up to 2, the stone
+    of a given color placed at square would have, including
+    liberties of friendly chains it merges with and squares
+    of enemy stones it captures
+    '''
+    bit = 1 << square
+    own = (self.black if color == BLACK else self.white) | bit
+    enemy = self.white if color == BLACK else self.black
+    empty = self.playable & ~(own | enemy)
+    captured = 0
+    around = self.dilate(bit) & enemy
+    while around:
+      chain = self.flood(around & -around, enemy)
+      if not self.dilate(chain) & empty: captured |= chain
+      around &= ~chain
+    liberties = self.dilate(self.flood(bit, own)) & (empty | captured)
+    return min(liberties.bit_count(), 2)
+
+  def read_ladder(self, stack, color, region):
+    '''
+    Iteratively simulates a ladder chasing on bitboards,
+    every stack frame holds stones of the chased color and
+    of the chaser, 2 liberties of the chased group and the
+    next liberty for the chaser to take, returns true if
+    the group gets caught along with the squares read
+    '''
+    steps = 0
+    while stack:
+      frame = stack[-1]
+      own, other, liberties, index = frame
+      if index == 2:
+        stack.pop()
+        continue
+      frame[3] = index + 1
+      escape = liberties[1-index]
+      steps += 1
+      if steps > self.ladder_steps: return False, region
+      own |= 1 << escape
+      other |= 1 << liberties[index]
+      around = self.dilate(self.flood(1 << escape, own))
+      region |= around
+      new_liberties = around & ~(own | other)
+      if new_liberties.bit_count() <= 1: return True, region
+      if new_liberties.bit_count() == 2: stack.append([own, other, bit_squares(new_liberties), 0])
+    return False, region
+
+  def check_ladder(self, square, color):
+    '''
+    Return true if ladder is working and false otherwise,
+    initial group to check should contain 2 liberties,
+    returns the chaser's first move for such a group,
+    results are cached until a square they were read
+    from changes
+    '''
+    key = (square, color)
+    if key in self.ladder_cache: return self.ladder_cache[key]
+    own = self.black if color == BLACK else self.white
+    other = self.white if color == BLACK else self.black
+    region = self.dilate(self.flood(1 << square, own))
+    liberties = bit_squares(region & ~(own | other))
+    ladder = 0
+    if len(liberties) == 0: ladder = 1
+    elif len(liberties) == 1:
+      own |= 1 << liberties[0]
+      around = self.dilate(self.flood(1 << liberties[0], own))
+      region |= around
+      new_liberties = around & ~(own | other)
+      if new_liberties.bit_count() <= 1: ladder = 1
+      elif new_liberties.bit_count() == 2:
+        caught, region = self.read_ladder([[own, other, bit_squares(new_liberties), 0]], color, region)
+        if caught: ladder = 1
+    elif len(liberties) == 2:
+      stack = [[own, other, liberties, 0]]
+      caught, region = self.read_ladder(stack, color, region)
+      if caught: ladder = liberties[stack[0][3]-1]
+    self.ladder_cache[key] = ladder
+    ladder_watch = self.ladder_watch
+    for read in bit_squares(region): ladder_watch.setdefault(read, set()).add(key)
+    return ladder
+
+# BOARD BACKENDS            # name -> position class, selected by --board and GTP "gakusei-board"
+backends = {'list': Position, 'bits': BitPosition}
+
+class Book:
   '''
-  Root moves search
+  Persistent cache of searched root results: an open
+  addressing hash table of fixed size records in a file
+  mapped into memory, a record is found by linear probing
+  from the slot its position key points to, the map is
+  read only unless the book is opened for writing, so
+  processes reading the same file share its pages
   '''
-  global board, groups, side, ko, best_move
-  best_score = -10000
-  temp_best = NONE
-  moves = genmove(side)
-  for move in moves:
-    old_board = deepcopy(board)
-    old_groups = deepcopy(groups)
-    old_side = side
-    old_ko = ko
-    if move != NONE: play(move[0][0], move[0][1], side)
-    score = -negamax(depth-1, -10000, 10000)
-    print('>', move_to_string(move[0]), move, -score if side == BLACK else score, file=sys.stderr)
-    board = old_board
-    groups = old_groups
-    side = old_side
-    ko = old_ko
-    if score > best_score:
-      best_score = score
-      temp_best = move
-  best_move = temp_best
-  return best_score
-
-def negamax(depth, alpha, beta):
-  '''
-  Recursive alpha beta search
-  '''
-  global board, groups, side, ko, best_move
-  if depth == 0:
-    score = evaluate()
-    #print_board()
-    #print(score)
-    return score
-  moves = genmove(side)
-  if len(moves):
-    for move in genmove(side):
-      old_board = deepcopy(board)
-      old_groups = deepcopy(groups)
-      old_side = side
-      old_ko = ko
-      if move != NONE: play(move[0][0], move[0][1], side)
-      score = -negamax(depth-1, -beta, -alpha)
-      board = old_board
-      groups = old_groups
-      side = old_side
-      ko = old_ko
-      if score > alpha:
-        if score >= beta: break
-        alpha = score
-        best_move = move
-  best_move = NONE
-  return alpha
-
-def evaluate():
-  '''
-  Score position based on resulting influence
-  '''
-  score = 0
-  for row in range(width):
-    for col in range(width):
-      if board[row][col] == BLACK: score += 60 + get_influence(col, row)
-      if board[row][col] == WHITE: score -= 60 - get_influence(col, row)
-  return score if side == BLACK else -score
-
-def search(command):
-  '''
-  Find and make best move
-  '''
-  color = BLACK if command.split()[-1].upper() == 'B' else WHITE
-  moves = [move_to_string(m[0]) for m in genmove(color)]
-  best_score = root(5, color)
-  if best_move != NONE:
-    play(best_move[0][0], best_move[0][1], color)
-    print('= ' + move_to_string(best_move[0]) + '\n')
-    if move_to_string(best_move[0]) not in moves:
-      print('ERROR MOVE', file=sys.stderr)
-      sys.exit(1)
-  else: print('= pass\n')
-
-def move_to_string(move):
-  '''
-  Convert move coords to algebraic notation
-  '''
-  global width
-  col = chr(move[0]-(1 if move[0]<=8 else 0)+ord('A'))
-  row = str(width-move[1]-1)
-  return col+row
-
-def gtp():
-  '''
-  Go Text Protocol command loop
-  '''
-  global width, side, best_move
-  while True:
-    command = input()
-    if 'name' in command: print('= Gakusei\n')
-    elif 'protocol_version' in command: print('= 2\n');
-    elif 'version' in command: print('=', 'by Code Monkey King\n')
-    elif 'list_commands' in command: print('= protocol_version\n')
-    elif 'boardsize' in command: width = int(command.split()[1])+2; print('=\n')
-    elif 'clear_board' in command: init_board(); print('=\n')
-    elif 'showboard' in command: print('= ', end=''); print_board()
+  __slots__ = ('file', 'map', 'slots')
+
+  def __init__(self, path, slots=None):
+    '''
+    Opens book file for reading, for writing if the number of
+    slots is given, a missing file is then created empty
+    '''
+    if slots is not None and not os.path.exists(path):
+      with open(path, 'wb') as file:
+        file.write(book_header.pack(b'GKSB', slots))
+        file.truncate(book_header.size + slots * book_record.size)
+    self.file = open(path, 'rb' if slots is None else 'r+b')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ if slots is None else mmap.ACCESS_WRITE)
+    magic, self.slots = book_header.unpack_from(self.map)
+    if magic != b'GKSB' or len(self.map) != book_header.size + self.slots * book_record.size:
+      self.close()
+      raise ValueError('not a book file: ' + path)
+
+  def close(self):
+    '''
+    Unmaps and closes the book file
+    '''
+    self.map.close()
+    self.file.close()
+
+  def probe(self, key, width, side):
+    '''
+    Returns offset and record of a position, offset of the
+    empty slot it belongs to and None if it is not stored,
+    (None, None) if the book is full
+    '''
+    slot = key % self.slots
+    for _ in range(self.slots):
+      offset = book_header.size + slot * book_record.size
+      record = book_record.unpack_from(self.map, offset)
+      if record[:3] == (key, width, side): return offset, record
+      if record[1] == 0: return offset, None
+      slot = (slot + 1) % self.slots
+    return None, None
+
+  def lookup(self, position):
+    '''
+    Returns (move, score, depth) stored for a position or None
+    '''
+    offset, record = self.probe(position.position_key(), position.width, position.side)
+    return record[3:] if record is not None else None
+
+  def store(self, position, move, score, depth):
+    '''
+    Stores root search result of a position unless a search
+    as deep is stored already, returns True if stored
+    '''
+    key = position.position_key()
+    offset, record = self.probe(key, position.width, position.side)
+    if offset is None or (record is not None and record[5] >= depth): return False
+    book_record.pack_into(self.map, offset, key, position.width, position.side, move, score, depth)
+    return True
+
+class Engine:
+  '''
+  Plays a game on its position: searches moves, keeps the
+  transposition table, clock and settings of the game and
+  answers GTP commands, many engines can share a process
+  '''
+  __slots__ = (
+    'position', 'tt', 'tt_age', 'best_move', 'max_depth', 'deadline', 'stop_search',
+    'time_limits', 'clock', 'threads', 'pool', 'pool_size', 'pool_alpha', 'nodes', 'stats_log',
+    'move_cache', 'killers', 'history_scores', 'pending', 'batch_leaves', 'book',
+    'ponder_replies', 'background', 'pondered', 'aspiration', 'report', 'analyze_interval'
+  )
+
+  def __init__(self, position=None, tt_size=1 << 18):
+    self.position = position if position is not None else Position()
+    self.tt = [None] * tt_size              # (key, depth, bound, score, move, age) entries
+    self.tt_age = 0                         # search counter, entries of older searches get replaced first
+    self.best_move = NONE                   # best move after search
+    self.max_depth = 5                      # depth of the last iterative deepening iteration
+    self.aspiration = 100                   # root window around the score of the previous iteration
+    self.report = None                      # called with (move, score, depth, nodes) of every root move searched
+    self.analyze_interval = 1.0             # seconds between lines of GTP "gakusei-analyze" output
+    self.deadline = None                    # time the current search has to stop at, None for no limit
+    self.stop_search = False                # set when deadline passes, unfinished iteration gets discarded
+    self.time_limits = None                 # (main time, byo yomi time, byo yomi stones) from GTP "time_settings"
+    self.clock = {}                         # color -> [time left, stones left] from GTP "time_left"
+    self.threads = 1                        # number of processes searching root moves
+    self.pool = None                        # root search worker processes
+    self.pool_size = 0                      # number of processes in the pool
+    self.pool_alpha = None                  # best root score found so far, shared by worker processes
+    self.nodes = 0                          # number of positions visited by negamax, used by benchmarks
+    self.stats_log = False                  # print JSON line with statistics of every genmove to STDERR
+    self.move_cache = {}                    # position key -> genmove() list, kept for one search
+    self.killers = []                       # 2 last moves causing beta cutoff at every ply
+    self.history_scores = []                # history heuristic scores indexed by color and square
+    self.pending = []                       # (color, square) moves of GTP "play" not applied yet
+    self.batch_leaves = False               # score children of depth 1 nodes in one numpy pass
+    self.book = None                        # Book of searched root results consulted before searching
+    self.ponder_replies = 0                 # opponent replies searched after genmove, 0 to not ponder
+    self.background = None                  # thread pondering or analysing while waiting for a command
+    self.pondered = {}                      # position key -> (best move, depth) found while pondering
+    self.reset_ordering()
+
+  def set_tt_size(self, size):
+    '''
+    Resizes transposition table to the largest
+    power of two number of entries not above size
+    '''
+    entries = 1
+    while entries * 2 <= size: entries *= 2
+    self.tt = [None] * entries
+
+  def tt_probe(self, key):
+    '''
+    Returns transposition table entry of a position
+    or None if the position has not been stored
+    '''
+    entry = self.tt[key & (len(self.tt)-1)]
+    if entry is not None and entry[0] == key: return entry
+    return None
+
+  def tt_store(self, key, depth, bound, score, move):
+    '''
+    Stores search result in transposition table, entry in
+    the slot is kept only if it's from the current search,
+    of another position and searched deeper
+    '''
+    tt = self.tt
+    index = key & (len(tt)-1)
+    entry = tt[index]
+    if entry is not None and entry[0] != key and entry[5] == self.tt_age and entry[1] > depth: return
+    tt[index] = (key, depth, bound, score, move, self.tt_age)
+
+  def reset_ordering(self):
+    '''
+    Clears move cache and killer moves and ages history
+    scores before a new search
+    '''
+    size = self.position.width * self.position.width
+    self.move_cache = {}
+    self.killers = [[NONE, NONE] for _ in range(self.max_depth + 1)]
+    if len(self.history_scores) != 3 or len(self.history_scores[BLACK]) != size:
+      self.history_scores = [[0] * size for _ in range(3)]
+    for scores in self.history_scores:
+      for square in range(size): scores[square] >>= 1
+
+  def node_moves(self, key, color):
+    '''
+    Returns genmove() list of the position with a given key,
+    every list is generated once during a search
+    '''
+    moves = self.move_cache.get(key)
+    if moves is None: moves = self.move_cache[key] = self.position.genmove(color)
+    return moves
+
+  def order_moves(self, moves, tt_move, ply, color):
+    '''
+    Orders moves for the search: transposition table move
+    first, killer moves of the ply next and the rest by
+    history score, equal moves keep their urgency order
+    '''
+    killers = self.killers[ply] if ply < len(self.killers) else (NONE, NONE)
+    scores = self.history_scores[color]
+    def rank(move):
+      square = move[0]
+      if square == tt_move: return (0, 0)
+      if square == killers[0]: return (1, 0)
+      if square == killers[1]: return (2, 0)
+      return (3, -scores[square])
+    return sorted(moves, key=rank)
+
+  def update_ordering(self, move, depth, ply, color):
+    '''
+    Remembers move causing beta cutoff as killer move
+    of the ply and raises its history score
+    '''
+    if ply < len(self.killers):
+      killers = self.killers[ply]
+      if killers[0] != move: killers[1], killers[0] = killers[0], move
+    self.history_scores[color][move] += depth * depth
+
+  def set_backend(self, name):
+    '''
+    Moves current position to the board backend of a given
+    name keeping its settings, history is cleared
+    '''
+    old = self.position
+    position = backends[name](old.width)
+    position.ladder_steps = old.ladder_steps
+    position.use_numpy = old.use_numpy
+    position.load(bytes(old.board), old.side, old.ko)
+    self.position = position
+
+  def start_pool(self):
+    '''
+    Starts root search worker processes unless the
+    pool of the requested size is already running
+    '''
+    if self.pool is not None and self.pool_size == self.threads: return
+    if self.pool is not None: self.pool.terminate()
+    self.pool_alpha = multiprocessing.Value('i', -10000)
+    self.pool = multiprocessing.Pool(self.threads, initializer=init_worker, initargs=(self.pool_alpha,))
+    self.pool_size = self.threads
+
+  def root(self, depth, color, first_move=NONE, moves=None, alpha=-10000, beta=10000):
+    '''
+    Root moves search, first_move is searched first,
+    moves are generated unless given, they are shared
+    among worker processes if there are more than one
+    threads, the rest of the moves are searched with
+    null window around the best score so far unless
+    every score is reported to analysis, returns
+    the best score, alpha or less if the search failed
+    low, beta or more if it failed high
+    '''
+    position = self.position
+    window = (alpha, beta)
+    best_score = -10000
+    temp_best = NONE
+    if moves is None: moves = position.genmove(position.side)
+    if first_move != NONE: moves = tt_order(moves, first_move[0])
+    if self.threads > 1:
+      self.start_pool()
+      self.pool_alpha.value = -10000
+      snapshot = (
+        position.width, bytes(position.board), position.side, position.ko,
+        position.ladder_steps, position.use_numpy, position.backend, len(self.tt)
+      )
+      tasks = [snapshot + (move[0], depth, self.deadline) for move in moves]
+      scores = self.pool.map(search_move, tasks, chunksize=1)
+    for index, move in enumerate(moves):
+      if self.threads > 1:
+        score, count = scores[index]
+        self.nodes += count
+        if score is None: self.stop_search = True
+      else:
+        nodes = self.nodes
+        if move != NONE: position.play(move[0], position.side)
+        if index == 0 or depth == 1 or self.report is not None: score = -self.negamax(depth-1, -beta, -alpha)
+        else:
+          score = -self.negamax(depth-1, -alpha-1, -alpha)
+          if alpha < score < beta: score = -self.negamax(depth-1, -beta, -alpha)
+        if move != NONE: position.undo()
+      if self.stop_search: return best_score
+      print('>', position.move_to_string(move[0]), move, -score if position.side == WHITE else score, file=sys.stderr)
+      if self.report is not None: self.report(move, score, depth, count if self.threads > 1 else self.nodes - nodes)
+      if score > best_score:
+        best_score = score
+        temp_best = move
+      if score >= beta: break
+      if self.report is None: alpha = max(alpha, score)
+    self.best_move = temp_best
+    if temp_best != NONE and window[0] < best_score < window[1]:
+      self.tt_store(position.position_key(), depth, EXACT, best_score, temp_best[0])
+    return best_score
+
+  def negamax(self, depth, alpha, beta, ply=1):
+    '''
+    Recursive alpha beta search, ply counts
+    moves made from the root position
+    '''
+    self.nodes += 1
+    if self.deadline is not None and time.time() > self.deadline: self.stop_search = True
+    if self.stop_search: return 0
+    position = self.position
+    if depth == 0:
+      score = position.evaluate()
+      #position.print_board()
+      #print(score)
+      return score
+    key = position.position_key()
+    entry = self.tt_probe(key)
+    tt_move = NONE
+    if entry is not None:
+      tt_move = entry[4]
+      if entry[1] >= depth:
+        if entry[2] != UPPER and entry[3] >= beta: return beta
+        if entry[2] != LOWER and entry[3] <= alpha: return alpha
+        if entry[2] == EXACT: return entry[3]
+    old_alpha = alpha
+    node_best = NONE
+    color = position.side
+    moves = self.node_moves(key, color)
+    if len(moves):
+      ordered = self.order_moves(moves, tt_move, ply, color)
+      scores = self.evaluate_children(ordered, color) if depth == 1 and self.batch_leaves else None
+      for index, move in enumerate(ordered):
+        if scores is None:
+          if move != NONE: position.play(move[0], color)
+          if index == 0 or depth == 1: score = -self.negamax(depth-1, -beta, -alpha, ply+1)
+          else:
+            score = -self.negamax(depth-1, -alpha-1, -alpha, ply+1)
+            if alpha < score < beta: score = -self.negamax(depth-1, -beta, -alpha, ply+1)
+          if move != NONE: position.undo()
+          if self.stop_search: return 0
+        else: score = scores[index]
+        if score > alpha:
+          if score >= beta:
+            self.tt_store(key, depth, LOWER, beta, move[0])
+            self.update_ordering(move[0], depth, ply, color)
+            return beta
+          alpha = score
+          node_best = move[0]
+    self.tt_store(key, depth, EXACT if alpha > old_alpha else UPPER, alpha, node_best)
+    return alpha
+
+  def evaluate_children(self, moves, color):
+    '''
+    Scores positions after each of moves at once: boards
+    of the children are stacked into (N, width, width)
+    array and evaluated by a single numpy pass, returns
+    scores from the point of view of the side to move
+    '''
+    position = self.position
+    width = position.width
+    boards = numpy.empty((len(moves), width, width), dtype=numpy.uint8)
+    for index, move in enumerate(moves):
+      position.play(move[0], color)
+      boards[index] = numpy.frombuffer(position.board, dtype=numpy.uint8).reshape(width, width)
+      position.undo()
+    self.nodes += len(moves)
+    scores = position.evaluate_boards(boards)
+    return (scores if color == BLACK else -scores).tolist()
+
+  def time_budget(self, color):
+    '''
+    Returns seconds to spend on the next move based on
+    GTP time settings and time left, None if unlimited
+    '''
+    if self.time_limits is None: return None
+    main_time, byo_yomi_time, byo_yomi_stones = self.time_limits
+    if byo_yomi_time > 0 and byo_yomi_stones == 0: return None
+    time_left, stones_left = self.clock.get(color, [main_time, 0])
+    if stones_left > 0: return max(time_left / stones_left * 0.8 - 0.1, 0.05)
+    budget = time_left / max(self.position.board.count(EMPTY) // 3, 10)
+    if byo_yomi_stones > 0: budget = max(budget, byo_yomi_time / byo_yomi_stones * 0.8 - 0.1)
+    return max(budget, 0.05)
+
+  def update_clock(self, color, elapsed):
+    '''
+    Takes time spent on a move from the clock of a given color,
+    GTP "time_left" overrides it with the controller's clock
+    '''
+    if self.time_limits is None: return
+    main_time, byo_yomi_time, byo_yomi_stones = self.time_limits
+    time_left, stones_left = self.clock.get(color, [main_time, 0])
+    time_left -= elapsed
+    if stones_left > 0:
+      stones_left -= 1
+      if stones_left == 0: time_left, stones_left = byo_yomi_time, byo_yomi_stones
+    elif time_left <= 0 and byo_yomi_stones > 0:
+      time_left, stones_left = byo_yomi_time + time_left, byo_yomi_stones
+    self.clock[color] = [time_left, stones_left]
+
+  def search(self, command):
+    '''
+    Find and make best move, deepens search iteratively
+    until max_depth or the time budget is exhausted,
+    returns GTP response
+    '''
+    position = self.position
+    color = BLACK if command.split()[-1].upper() == 'B' else WHITE
+    if color != position.side: position.side, position.ko = color, NONE # GTP lets a color move twice in a row
+    before = (read_stats(), self.nodes) if self.stats_log else None
+    self.tt_age += 1
+    self.reset_ordering()
+    candidates = position.genmove(color)
+    moves = [position.move_to_string(m[0]) for m in candidates]
+    start = time.time()
+    budget = self.time_budget(color)
+    self.deadline = start + budget if budget is not None else None
+    self.stop_search = False
+    best = self.book_move(color, candidates)
+    done = self.max_depth if best != NONE else 0
+    if best == NONE: best, done = self.pondered_move(color, candidates)
+    score = None
+    for depth in range(done+1, self.max_depth+1):
+      root_moves = candidates
+      window = (-10000, 10000)
+      if score is not None and self.threads == 1: window = (score - self.aspiration, score + self.aspiration)
+      score = self.root(depth, color, best, root_moves, *window)
+      if not self.stop_search and not window[0] < score < window[1]: score = self.root(depth, color, best, root_moves)
+      if self.stop_search: break
+      best = self.best_move
+      if self.deadline is not None and time.time() - start > budget / 2: break
+    self.deadline = None
+    self.stop_search = False
+    self.best_move = best if best != NONE or len(candidates) == 0 else candidates[0]
+    self.update_clock(color, time.time() - start)
+    if self.stats_log: self.print_move_stats(before, self.best_move, time.time() - start)
+    if self.best_move == NONE: return '= pass'
+    if position.move_to_string(self.best_move[0]) not in moves: return '? search returned an illegal move'
+    position.play(self.best_move[0], color)
+    return '= ' + position.move_to_string(self.best_move[0])
+
+  def book_move(self, color, candidates):
+    '''
+    Returns candidate move stored in the book for current
+    position searched at least as deep as max_depth, NONE
+    if there is none
+    '''
+    if self.book is None or color != self.position.side: return NONE
+    entry = self.book.lookup(self.position)
+    if entry is None or entry[2] < self.max_depth: return NONE
+    for move in candidates:
+      if move[0] == entry[0]: return move
+    return NONE
+
+  def pondered_move(self, color, candidates):
+    '''
+    Returns (candidate move, depth) pondering found for current
+    position, (NONE, 0) if the opponent played a reply that
+    was not pondered
+    '''
+    if color != self.position.side: return NONE, 0
+    move, depth = self.pondered.get(self.position.position_key(), (NONE, 0))
+    for candidate in candidates:
+      if candidate[0] == move: return candidate, depth
+    return NONE, 0
+
+  def ponder(self):
+    '''
+    Searches positions after the most likely opponent replies,
+    transposition table move first and then the most urgent
+    ones, deepening them in turn until max_depth or stop_search,
+    best move and depth reached are kept for every reply,
+    search data goes to transposition table as usual
+    '''
+    position = self.position
+    color = position.side
+    self.pondered = {}
+    replies = position.genmove(color)
+    entry = self.tt_probe(position.position_key())
+    if entry is not None and entry[4] != NONE: replies = tt_order(replies, entry[4])
+    replies = [move[0] for move in replies[:self.ponder_replies]]
+    threads, self.threads = self.threads, 1
+    self.tt_age += 1
+    self.reset_ordering()
+    for depth in range(1, self.max_depth+1):
+      for reply in replies:
+        position.play(reply, color)
+        key = position.position_key()
+        best = self.pondered.get(key, (NONE, 0))[0]
+        candidates = position.genmove(3-color)
+        self.root(depth, 3-color, next((move for move in candidates if move[0] == best), NONE), candidates)
+        position.undo()
+        if self.stop_search: break
+        if self.best_move != NONE: self.pondered[key] = (self.best_move[0], depth)
+      if self.stop_search: break
+    self.threads = threads
+
+  def analyze(self):
+    '''
+    Deepens search of current position in a thread of its
+    own until stop_search, every root move is reported with
+    its score, depth and nodes as soon as its search
+    completes, reports are printed every analyze_interval,
+    ends the GTP response with an empty line once stopped
+    '''
+    position = self.position
+    color = position.side
+    candidates = position.genmove(color)
+    lines = []
+    def report(move, score, depth, nodes):
+      lines.append('info move %s score %d depth %d nodes %d' % (position.move_to_string(move[0]), score, depth, nodes))
+    def deepen():
+      best = NONE
+      for depth in range(1, 100 if len(candidates) else 1):
+        self.move_cache.clear() # kept for one iteration, analysis has no depth limit to bound it
+        self.root(depth, color, best, candidates)
+        if self.stop_search: break
+        best = self.best_move
+    def flush():
+      count = len(lines)
+      if count: print('\n'.join(lines[:count]), flush=True)
+      del lines[:count]
+    threads, self.threads = self.threads, 1
+    self.tt_age += 1
+    self.reset_ordering()
+    self.report = report
+    search = threading.Thread(target=deepen)
+    search.start()
+    printed = time.time()
+    while not self.stop_search:
+      time.sleep(0.01)
+      if time.time() - printed >= self.analyze_interval:
+        flush()
+        printed = time.time()
+    search.join()
+    self.report = None
+    self.threads = threads
+    lines.append('')
+    flush()
+
+  def start_background(self, target):
+    '''
+    Starts pondering or analysis in a background thread
+    '''
+    self.stop_search = False
+    self.deadline = None
+    self.background = threading.Thread(target=target, daemon=True)
+    self.background.start()
+
+  def stop_background(self):
+    '''
+    Aborts pondering or analysis and waits until the
+    position is restored
+    '''
+    if self.background is None: return
+    self.stop_search = True
+    self.background.join()
+    self.background = None
+    self.stop_search = False
+
+  def open_book(self, path):
+    '''
+    Opens book file read only, closes the book if path is
+    "off", returns GTP response
+    '''
+    if self.book is not None: self.book.close()
+    self.book = None
+    if path == 'off': return '='
+    try: self.book = Book(path)
+    except (OSError, ValueError): return '? cannot open book'
+    return '='
+
+  def print_move_stats(self, before, move, elapsed):
+    '''
+    Prints JSON line with statistics gathered since before
+    was read, search time and the move found to STDERR
+    '''
+    calls_before, nodes_before = before
+    line = {'move': self.position.move_to_string(move[0]) if move != NONE else 'pass', 'seconds': round(elapsed, 6)}
+    line['nodes'] = self.nodes - nodes_before
+    for name, (calls, seconds) in read_stats().items():
+      old_calls, old_seconds = calls_before.get(name, (0, 0.0))
+      line[name] = {'calls': calls - old_calls, 'seconds': round(seconds - old_seconds, 6)}
+    print(json.dumps(line), file=sys.stderr)
+
+  def flush_moves(self):
+    '''
+    Applies moves queued by GTP "play", long sequences
+    go through a single setup() instead of play() calls
+    '''
+    moves, self.pending = self.pending, []
+    position = self.position
+    if len(moves) >= setup_batch: position.setup(moves)
+    else:
+      for color, square in moves:
+        if square != NONE: position.play(square, color)
+        else:
+          position.side = (3-color)
+          position.ko = NONE
+
+  def load_sgf(self, params):
+    '''
+    Sets up position of the first game in SGF file
+    before a given move number, returns GTP response
+    '''
+    try:
+      with open(params[0], encoding='utf-8', errors='replace') as file: game = next(read_sgf(file), None)
+    except OSError: return '? cannot load file'
+    if game is None: return '? cannot load file'
+    position = self.position
+    position.init_board(sgf_width(game))
+    position.setup(sgf_moves(game, position.width, int(params[1]) - 1 if len(params) > 1 else None))
+    return '='
+
+  def place_handicap(self, squares):
+    '''
+    Places black handicap stones on an empty board,
+    returns GTP response
+    '''
+    position = self.position
+    if BLACK in position.board or WHITE in position.board: return '? board not empty'
+    if len(squares) < 2: return '? invalid number of stones'
+    position.setup([(BLACK, square) for square in squares])
+    return '= ' + ' '.join(position.move_to_string(square) for square in squares)
+
+  def execute(self, command):
+    '''
+    Executes Go Text Protocol command, returns
+    the response or None when asked to quit
+    '''
+    position = self.position
+    if self.pending and not command.startswith('play'): self.flush_moves()
+    if 'loadsgf' in command: return self.load_sgf(command.split()[1:])
+    elif 'gakusei-book' in command: return self.open_book(command.split()[-1])
+    elif 'name' in command: return '= Gakusei'
+    elif 'protocol_version' in command: return '= 2'
+    elif 'version' in command: return '= by Code Monkey King'
+    elif 'list_commands' in command: return '= protocol_version'
+    elif 'boardsize' in command: position.init_board(int(command.split()[1])+2); return '='
+    elif 'clear_board' in command: position.init_board(); return '='
+    elif 'showboard' in command: return '= ' + position.board_string()
     elif 'play' in command:
-      if 'pass'.upper() not in command:
-        params = command.split()
-        color = BLACK if params[1] == 'B' else WHITE
-        col = ord(params[2][0])-ord('A')+(1 if ord(params[2][0]) <= ord('H') else 0)
-        row = width-int(params[2][1:])-1
-        play(col, row, color)
-        print('=\n')
+      params = command.split()
+      if len(params) < 3: return '? syntax error'
+      color = BLACK if params[1].upper().startswith('B') else WHITE
+      square = NONE
+      if params[2].upper() != 'PASS':
+        square = position.vertex_to_move(params[2].upper())
+        if square == NONE: return '? illegal move'
+        if position.board[square] != EMPTY or any(move[1] == square for move in self.pending): self.flush_moves()
+        if position.board[square] != EMPTY: return '? illegal move'
+      self.pending.append((color, square))
+      return '='
+    elif 'fixed_handicap' in command or 'place_free_handicap' in command:
+      return self.place_handicap(position.handicap(int(command.split()[1])))
+    elif 'set_free_handicap' in command:
+      squares = [position.vertex_to_move(vertex.upper()) for vertex in command.split()[1:]]
+      if NONE in squares or len(set(squares)) != len(squares): return '? illegal vertex'
+      response = self.place_handicap(squares)
+      return '=' if response.startswith('=') else response
+    elif 'genmove' in command: return self.search(command)
+    elif 'time_settings' in command:
+      self.time_limits = tuple(int(param) for param in command.split()[1:4])
+      self.clock.clear()
+      return '='
+    elif 'time_left' in command:
+      params = command.split()
+      self.clock[BLACK if params[1].upper().startswith('B') else WHITE] = [float(params[2]), int(params[3])]
+      return '='
+    elif 'gakusei-tt_size' in command: self.set_tt_size(int(command.split()[1])); return '='
+    elif 'gakusei-ladder_steps' in command: position.ladder_steps = int(command.split()[1]); return '='
+    elif 'gakusei-threads' in command: self.threads = max(int(command.split()[1]), 1); return '='
+    elif 'gakusei-stats' in command:
+      params = command.split()[1:]
+      if params == ['on']: set_stats(True)
+      elif params == ['off']: set_stats(False)
+      elif params == ['reset']: reset_stats(); self.nodes = 0
+      elif params[:1] == ['log']: self.stats_log = params[-1] == 'on'
+      if len(params): return '='
+      lines = ['nodes %d' % self.nodes]
+      for name, (calls, seconds) in read_stats().items(): lines.append('%s %d calls %.6fs' % (name, calls, seconds))
+      return '= ' + '\n'.join(lines)
+    elif 'gakusei-board' in command:
+      name = command.split()[-1]
+      if name not in backends: return '? unknown board backend'
+      self.set_backend(name)
+      return '='
+    elif 'gakusei-analyze' in command:
+      params = command.split()[1:]
+      self.analyze_interval = int(params[0]) / 100 if len(params) else 1.0
+      return '='
+    elif 'gakusei-ponder' in command:
+      param = command.split()[-1]
+      self.ponder_replies = 0 if param == 'off' else 1 if param == 'on' else int(param)
+      return '='
+    elif 'gakusei-batch' in command:
+      enable = command.split()[-1] == 'on'
+      if enable and numpy is None: return '? numpy is not installed'
+      self.batch_leaves = enable
+      return '='
+    elif 'gakusei-numpy' in command:
+      enable = command.split()[-1] == 'on'
+      if enable and numpy is None: return '? numpy is not installed'
+      position.use_numpy = enable
+      return '='
+    elif 'quit' in command: return None
+    else: return '=' # skip currently unsupported commands
+
+  def answer(self, command):
+    '''
+    Executes GTP command, missing or malformed arguments
+    and any other failure are answered with an error response
+    '''
+    try: return self.execute(command)
+    except (IndexError, ValueError): return '? syntax error'
+    except Exception as error: return '? ' + (str(error) or type(error).__name__)
+
+  def gtp(self):
+    '''
+    Go Text Protocol command loop
+    '''
+    while True:
+      command = input()
+      self.stop_background()
+      response = self.answer(command)
+      if response is None: sys.exit()
+      if 'gakusei-analyze' in command and response == '=':
+        print('=', flush=True)
+        self.start_background(self.analyze)
+        continue
+      print(response + '\n')
+      if self.ponder_replies and 'genmove' in command and response != '= pass': self.start_background(self.ponder)
+
+async def serve_session(reader, writer, new_engine, executor):
+  '''
+  Answers GTP commands of one client with an engine of its
+  own, searches run on the executor so the server keeps
+  answering commands of other sessions meanwhile
+  '''
+  engine = new_engine()
+  loop = asyncio.get_running_loop()
+  try:
+    while True:
+      line = await reader.readline()
+      if not line: break
+      command = line.decode('utf-8', errors='replace').strip()
+      if not command: continue
+      params = command.split()
+      if any(name in command for name in SERVER_REFUSED) or \
+         'gakusei-stats' in command and params[1:2] in (['on'], ['off'], ['reset']):
+        response = '? not available in server mode'
       else:
-        side = (3-side)
-        ko = [NONE, NONE]
-        print('=\n')
-    elif 'genmove' in command: search(command)
-    elif 'quit' in command: sys.exit()
-    else: print('=\n') # skip currently unsupported commands
+        if 'genmove' in command: response = await loop.run_in_executor(executor, engine.answer, command)
+        else: response = engine.answer(command)
+      writer.write(((response if response is not None else '=') + '\n\n').encode())
+      await writer.drain()
+      if response is None: break
+  except ConnectionError: pass
+  finally:
+    if engine.pool is not None: engine.pool.terminate()
+    writer.close()
+
+def serve(address, new_engine, workers):
+  '''
+  Serves GTP sessions on "host:port" TCP address or Unix
+  socket path, new_engine() makes the engine of a session,
+  sessions share pattern and board tables of the process
+  '''
+  async def main():
+    executor = concurrent.futures.ThreadPoolExecutor(workers)
+    handler = functools.partial(serve_session, new_engine=new_engine, executor=executor)
+    if ':' in address:
+      host, port = address.rsplit(':', 1)
+      server = await asyncio.start_server(handler, host or None, int(port))
+    else: server = await asyncio.start_unix_server(handler, address)
+    print('serving GTP on', address, file=sys.stderr)
+    async with server: await server.serve_forever()
+  try: asyncio.run(main())
+  except KeyboardInterrupt: pass
+
+def build_book(path, files, plies, slots, depth, threads):
+  '''
+  Searches positions before each of the first plies moves
+  of every game in SGF files and stores the results in the
+  book, creating it with a given number of slots if it does
+  not exist, positions already searched as deep are skipped
+  '''
+  book = Book(path, slots)
+  engine = Engine()
+  engine.max_depth = depth
+  engine.threads = threads
+  position = engine.position
+  stored = 0
+  for name in files:
+    before = stored
+    with open(name, encoding='utf-8', errors='replace') as file:
+      for game in read_sgf(file):
+        width = sgf_width(game)
+        played = sum(1 for node in game if 'B' in node or 'W' in node)
+        for limit in range(min(plies, played)):
+          position.init_board(width)
+          position.setup(sgf_moves(game, width, limit))
+          entry = book.lookup(position)
+          if entry is not None and entry[2] >= depth: continue
+          key = position.position_key()
+          engine.search('genmove ' + ('b' if position.side == BLACK else 'w'))
+          tt_entry = engine.tt_probe(key)
+          if engine.best_move == NONE or tt_entry is None: continue
+          position.undo()
+          if book.store(position, tt_entry[4], tt_entry[3], tt_entry[1]): stored += 1
+    print('%s: %d positions stored' % (name, stored - before), file=sys.stderr)
+  if engine.pool is not None: engine.pool.terminate()
+  book.close()
+  return stored
+
+def init_worker(alpha):
+  '''
+  Root search worker process initializer
+  '''
+  global pool_alpha
+  pool_alpha = alpha
+
+def search_move(task):
+  '''
+  Searches a single root move in a worker process,
+  task holds position snapshot, move, depth and deadline,
+  the search window's lower bound is one below the best
+  score other workers have found, so every move scoring
+  as high as the best one comes back with exact score,
+  the worker engine and its position are reused but every
+  task starts with empty tables, so its result does not
+  depend on tasks the worker searched before,
+  returns the score and the number of nodes searched
+  '''
+  global worker_engine
+  width, stones, color, ko_square, ladder_steps, use_numpy, backend, tt_size, move, depth, deadline = task
+  engine = worker_engine
+  if engine is None or engine.position.backend != backend or engine.position.width != width:
+    engine = worker_engine = Engine(backends[backend](width), tt_size)
+  else: engine.set_tt_size(tt_size)
+  position = engine.position
+  position.ladder_steps = ladder_steps
+  position.use_numpy = use_numpy
+  position.load(stones, color, ko_square)
+  engine.max_depth = depth
+  engine.history_scores = []
+  engine.reset_ordering()
+  engine.deadline = deadline
+  engine.stop_search = False
+  nodes = engine.nodes
+  alpha = pool_alpha.value
+  position.play(move, position.side)
+  score = -engine.negamax(depth-1, -10000, 1-alpha)
+  position.undo()
+  if engine.stop_search: return None, engine.nodes - nodes
+  with pool_alpha.get_lock():
+    if score > pool_alpha.value: pool_alpha.value = score
+  return score, engine.nodes - nodes
+
+def instrument(cls, name):
+  '''
+  Returns a wrapper of a position method counting
+  its calls and time spent in statistics
+  '''
+  method = cls.__dict__[name]
+  counter = stats.setdefault(name, [0, 0.0])
+  def wrapper(*args):
+    start = time.perf_counter()
+    try: return method(*args)
+    finally:
+      counter[0] += 1
+      counter[1] += time.perf_counter() - start
+  return wrapper
+
+def set_stats(enable):
+  '''
+  Turns statistics on by rebinding instrumented methods
+  to their wrappers and off by putting the originals back,
+  so nothing is paid for them while they are off
+  '''
+  for cls in backends.values():
+    for name in instrumented:
+      if name not in cls.__dict__: continue
+      if enable and (cls, name) not in originals:
+        originals[(cls, name)] = cls.__dict__[name]
+        setattr(cls, name, instrument(cls, name))
+      elif not enable and (cls, name) in originals:
+        setattr(cls, name, originals.pop((cls, name)))
+
+def reset_stats():
+  '''
+  Zeroes counters of instrumented methods
+  '''
+  for counter in stats.values(): counter[0], counter[1] = 0, 0.0
+
+def read_stats():
+  '''
+  Returns statistics as a dictionary of
+  method name -> (calls, seconds)
+  '''
+  return {name: (counter[0], round(counter[1], 6)) for name, counter in stats.items()}
 
 # MAIN
-width=19+2;   # set board width + offboard squares
-init_board(); # set up board
-gtp()         # start GTP IO communication
+compile_patterns(); # build pattern lookup table
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Gakusei GTP engine')
+  parser.add_argument('--threads', type=int, default=1, help='number of processes searching root moves')
+  parser.add_argument('--stats', action='store_true', help='print JSON line with statistics of every genmove to STDERR')
+  parser.add_argument('--board', choices=sorted(backends), default='list', help='board backend')
+  parser.add_argument('--book', help='book file of searched positions consulted before searching')
+  parser.add_argument('--build-book', metavar='BOOK', help='search openings of SGF files into a book file and exit')
+  parser.add_argument('--book-plies', type=int, default=20, help='moves of every game searched into the book')
+  parser.add_argument('--book-slots', type=int, default=1 << 16, help='number of records of a new book file')
+  parser.add_argument('--depth', type=int, default=5, help='iterative deepening depth of searches')
+  parser.add_argument('--ponder', type=int, nargs='?', const=1, default=0, metavar='REPLIES',
+                      help='search the most urgent opponent replies while waiting for a command')
+  parser.add_argument('--serve', metavar='ADDRESS', help='serve GTP sessions on host:port or Unix socket path')
+  parser.add_argument('--workers', type=int, default=4, help='searches the server runs at the same time')
+  parser.add_argument('sgf', nargs='*', help='SGF files to build the book from')
+  args = parser.parse_args()
+  if args.serve and args.ponder: parser.error('--ponder has no effect with --serve')
+  if args.build_book:
+    build_book(args.build_book, args.sgf, args.book_plies, args.book_slots, args.depth, max(args.threads, 1))
+    sys.exit()
+  if args.stats: set_stats(True)
+  def new_engine():
+    engine = Engine(backends[args.board]())
+    engine.threads = max(args.threads, 1)
+    engine.max_depth = args.depth
+    engine.ponder_replies = max(args.ponder, 0)
+    engine.stats_log = args.stats
+    if args.book and engine.open_book(args.book) != '=': sys.exit('cannot open book ' + args.book)
+    return engine
+  engine = new_engine()
+  if args.serve: serve(args.serve, new_engine, max(args.workers, 1))
+  else: engine.gtp() # start GTP IO communication